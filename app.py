@@ -4,12 +4,16 @@ from flask_migrate import Migrate
 from werkzeug.security import generate_password_hash
 from dotenv import load_dotenv
 import os
+import sys
 import logging
+import click
+from extensions import json_codec
 
 def create_app():
     load_dotenv("secrets.env")
 
     app = Flask(__name__)
+    app.json = json_codec.CodecJSONProvider(app)
 
     # Основные настройки
     app.config.update(
@@ -17,6 +21,8 @@ def create_app():
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
         SECRET_KEY=os.getenv('SECRET_KEY'),
         FERNET_KEY=os.getenv('FERNET_KEY'),
+        # JSON-колонки (матчи, статистика) через быстрый кодек
+        SQLALCHEMY_ENGINE_OPTIONS=dict(json_codec.ENGINE_OPTIONS),
 
 
         # Почта
@@ -69,13 +75,32 @@ def create_app():
         create_default_admin()
 
     # Инициализация планировщика задач
-    from pubg_api.scheduler import init_scheduler
+    # (задачи выполняет один процесс-лидер; `flask scheduler run` - отдельный процесс планировщика)
+    from pubg_api.scheduler import init_scheduler, scheduler_cli
     app.config['SCHEDULER_TIMEZONE'] = 'Europe/Moscow'
     init_scheduler(app)
+    app.cli.add_command(scheduler_cli)
+
+    # Обработчик персистентной очереди запросов к PUBG API
+    if serves_requests():
+        from services.job_queue import start_job_runner
+        start_job_runner(app)
 
     return app
 
 
+def serves_requests():
+    """
+    Обслуживает ли процесс приложение. Фоновые потоки не нужны разовым командам `flask ...`
+    (db upgrade и т.п.) и родительскому процессу перезагрузчика: запросы обслуживает дочерний
+    """
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        return True  # дочерний процесс перезагрузчика
+    if click.get_current_context(silent=True) is not None:
+        return sys.argv[1:2] == ['run'] and os.environ.get('FLASK_DEBUG') != '1'
+    return __name__ != '__main__'  # `python app.py` запускает app.run(debug=True) с перезагрузчиком
+
+
 def create_default_admin():
     from models import User, RoleEnum
     from extensions.db_connection import db
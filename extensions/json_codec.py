@@ -0,0 +1,67 @@
+import json
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson  # необязательная зависимость: в несколько раз быстрее стандартного json
+except ImportError:
+    orjson = None
+
+# Какой кодек используется: "orjson" или "json"
+BACKEND = "orjson" if orjson else "json"
+
+def loads(data):
+    """Разбор JSON из str или bytes"""
+    if orjson is None:
+        return json.loads(data)
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # Старые записи могут содержать NaN/Infinity, которые пишет только стандартный json
+        return json.loads(data)
+
+def dumps(obj, default=None, sort_keys=False, indent=None, passthrough=False) -> str:
+    """
+    Сериализация в строку JSON.
+
+    Args:
+        default: преобразование типов, которые кодек не умеет сериализовать
+        indent: отступ (orjson поддерживает только 2, иначе используется стандартный json)
+        passthrough: отдавать datetime/date и dataclass в default, а не сериализовать самостоятельно
+    """
+    if orjson is None or indent not in (None, 2):
+        separators = (",", ":") if indent is None else None  # компактно, как orjson
+        return json.dumps(obj, default=default, sort_keys=sort_keys, indent=indent, separators=separators)
+
+    option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    if passthrough:
+        option |= orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    return orjson.dumps(obj, default=default, option=option).decode()
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """JSON-ответы Flask (jsonify, request.get_json, tojson) через общий кодек"""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or set(kwargs) - {"default", "sort_keys", "indent", "separators", "ensure_ascii"}:
+            return super().dumps(obj, **kwargs)
+        return dumps(
+            obj,
+            default=kwargs.get("default", self.default),
+            sort_keys=kwargs.get("sort_keys", self.sort_keys),
+            indent=kwargs.get("indent"),
+            passthrough=True  # даты и dataclass - как в Flask (http_date, asdict)
+        )
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+# Сериализаторы для JSON-колонок SQLAlchemy (SQLALCHEMY_ENGINE_OPTIONS)
+ENGINE_OPTIONS = {
+    "json_serializer": dumps,
+    "json_deserializer": loads
+}
@@ -0,0 +1,135 @@
+"""Очередь запросов к API, негативный кэш, запуски задач и аренда планировщика
+
+Revision ID: 2b0fb377e062
+Revises: 9b4c196675e4
+Create Date: 2026-10-18 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b0fb377e062'
+down_revision = '9b4c196675e4'
+branch_labels = None
+depends_on = None
+
+
+def _existing_tables():
+    # create_app() вызывает db.create_all(), поэтому к моменту `flask db upgrade` таблицы могут уже быть
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def _existing_indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    tables = _existing_tables()
+
+    if 'api_job' not in tables:
+        op.create_table('api_job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=100), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('priority', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('idempotency_key', sa.String(length=255), nullable=True),
+        sa.Column('dedup_key', sa.String(length=255), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.String(length=1024), nullable=True),
+        sa.Column('run_after', sa.DateTime(), nullable=False),
+        sa.Column('claim_token', sa.String(length=64), nullable=True),
+        sa.Column('lease_until', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('idempotency_key')
+        )
+    indexes = _existing_indexes('api_job')
+    with op.batch_alter_table('api_job', schema=None) as batch_op:
+        if 'ix_api_job_claim' not in indexes:
+            batch_op.create_index('ix_api_job_claim', ['status', 'priority', 'run_after'], unique=False)
+        if 'ix_api_job_claim_token' not in indexes:
+            batch_op.create_index(batch_op.f('ix_api_job_claim_token'), ['claim_token'], unique=False)
+        if 'ix_api_job_dedup_key' not in indexes:
+            batch_op.create_index(batch_op.f('ix_api_job_dedup_key'), ['dedup_key'], unique=False)
+        if 'uq_api_job_active_dedup' not in indexes:
+            batch_op.create_index('uq_api_job_active_dedup', ['dedup_key'], unique=True,
+                                  sqlite_where=sa.text("status IN ('pending', 'running')"))
+
+    if 'api_negative_cache' not in tables:
+        op.create_table('api_negative_cache',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('cache_key', sa.String(length=255), nullable=False),
+        sa.Column('error', sa.String(length=512), nullable=True),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('cache_key')
+        )
+    if 'ix_api_negative_cache_expires_at' not in _existing_indexes('api_negative_cache'):
+        with op.batch_alter_table('api_negative_cache', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_api_negative_cache_expires_at'), ['expires_at'], unique=False)
+
+    if 'task_run' not in tables:
+        op.create_table('task_run',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('task_name', sa.String(length=100), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('resumed_from_id', sa.Integer(), nullable=True),
+        sa.Column('cursor', sa.JSON(), nullable=True),
+        sa.Column('outcomes', sa.JSON(), nullable=True),
+        sa.Column('total', sa.Integer(), nullable=True),
+        sa.Column('processed', sa.Integer(), nullable=True),
+        sa.Column('failed', sa.Integer(), nullable=True),
+        sa.Column('api_calls', sa.Integer(), nullable=True),
+        sa.Column('error', sa.String(length=1024), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['resumed_from_id'], ['task_run.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    indexes = _existing_indexes('task_run')
+    with op.batch_alter_table('task_run', schema=None) as batch_op:
+        if 'ix_task_run_task_name' not in indexes:
+            batch_op.create_index(batch_op.f('ix_task_run_task_name'), ['task_name'], unique=False)
+        if 'uq_task_run_running' not in indexes:
+            # Таблица могла накопить несколько "выполняющихся" запусков до появления индекса
+            op.execute(
+                "UPDATE task_run SET status = 'interrupted', finished_at = heartbeat_at "
+                "WHERE status = 'running' AND id NOT IN "
+                "(SELECT MAX(id) FROM task_run WHERE status = 'running' GROUP BY task_name)"
+            )
+            batch_op.create_index('uq_task_run_running', ['task_name'], unique=True,
+                                  sqlite_where=sa.text("status = 'running'"))
+
+    if 'scheduler_lease' not in tables:
+        op.create_table('scheduler_lease',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('holder', sa.String(length=255), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('acquired_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+        )
+
+
+def downgrade():
+    op.drop_table('scheduler_lease')
+    with op.batch_alter_table('task_run', schema=None) as batch_op:
+        batch_op.drop_index('uq_task_run_running')
+        batch_op.drop_index(batch_op.f('ix_task_run_task_name'))
+    op.drop_table('task_run')
+    with op.batch_alter_table('api_negative_cache', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_api_negative_cache_expires_at'))
+    op.drop_table('api_negative_cache')
+    with op.batch_alter_table('api_job', schema=None) as batch_op:
+        batch_op.drop_index('uq_api_job_active_dedup')
+        batch_op.drop_index(batch_op.f('ix_api_job_dedup_key'))
+        batch_op.drop_index(batch_op.f('ix_api_job_claim_token'))
+        batch_op.drop_index('ix_api_job_claim')
+    op.drop_table('api_job')
@@ -9,4 +9,8 @@ from .match import Match
 from .player_match_stats import PlayerMatchStats
 from .tasks import ScheduledTask
 from .join_requests import JoinRequests, RqStatusEnum
-from .ip_log import IPLog, IPStatusEnum
\ No newline at end of file
+from .ip_log import IPLog, IPStatusEnum
+from .api_negative_cache import ApiNegativeCache
+from .api_job import ApiJob, JobStatusEnum
+from .task_run import TaskRun, TaskRunStatusEnum
+from .scheduler_lease import SchedulerLease
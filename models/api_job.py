@@ -0,0 +1,45 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from extensions.db_connection import db
+
+class JobStatusEnum():
+    PENDING = 'pending'  # ждет выполнения (в т.ч. повтора)
+    RUNNING = 'running'  # взята воркером под аренду
+    DONE = 'done'
+    DEAD = 'dead'  # исчерпаны попытки (dead letter)
+
+    def __str__(self):
+        return self.value
+
+class ApiJob(db.Model):
+    """Персистентная очередь задач к PUBG API, общая для всех процессов"""
+    __tablename__ = 'api_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(100), nullable=False)  # имя зарегистрированного обработчика
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    priority = db.Column(db.Integer, nullable=False, default=10)
+    status = db.Column(db.String(16), nullable=False, default=JobStatusEnum.PENDING)
+    idempotency_key = db.Column(db.String(255), unique=True, nullable=True)
+    dedup_key = db.Column(db.String(255), index=True)  # не более одной ожидающей или выполняющейся задачи с этим ключом
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    last_error = db.Column(db.String(1024))
+
+    run_after = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(ZoneInfo("Europe/Moscow")))
+    claim_token = db.Column(db.String(64), index=True)
+    lease_until = db.Column(db.DateTime)
+
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(ZoneInfo("Europe/Moscow")))
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_api_job_claim', 'status', 'priority', 'run_after'),
+        # Гарантия dedup_key на уровне БД: одновременная постановка из двух процессов не создаст дубль
+        db.Index(
+            'uq_api_job_active_dedup', 'dedup_key',
+            unique=True,
+            sqlite_where=db.text("status IN ('pending', 'running')")
+        ),
+    )
@@ -0,0 +1,14 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from extensions.db_connection import db
+
+class ApiNegativeCache(db.Model):
+    """Запомненные постоянные ошибки PUBG API (например, несуществующий ник)"""
+    __tablename__ = 'api_negative_cache'
+
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(255), nullable=False, unique=True)
+    error = db.Column(db.String(512))
+    status_code = db.Column(db.Integer)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(ZoneInfo("Europe/Moscow")))
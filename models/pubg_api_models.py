@@ -24,6 +24,9 @@ class MatchStats(db.Model):
     data_json = db.Column(db.JSON, nullable=False)
     processed_at = db.Column(db.DateTime, default=lambda: datetime.now(ZoneInfo("Europe/Moscow")))
 
-    def to_match_data(self):
-        """Конвертирует запись БД в объект MatchData"""
-        return MatchData(self.data_json)
+    def to_match_data(self, keep_raw=True, lazy=False):
+        """
+        Конвертирует запись БД в объект MatchData
+        (keep_raw=False - без копии исходного JSON, lazy=True - участники разбираются при первом обращении)
+        """
+        return MatchData(self.data_json, keep_raw=keep_raw, lazy=lazy)
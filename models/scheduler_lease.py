@@ -0,0 +1,10 @@
+from extensions.db_connection import db
+
+class SchedulerLease(db.Model):
+    """Аренда лидерства: задачи планировщика выполняет только процесс-держатель"""
+    __tablename__ = 'scheduler_lease'
+
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(255), nullable=False)  # хост:pid:случайный суффикс процесса
+    expires_at = db.Column(db.DateTime, nullable=False)
+    acquired_at = db.Column(db.DateTime)
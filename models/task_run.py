@@ -0,0 +1,58 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from extensions.db_connection import db
+
+class TaskRunStatusEnum():
+    RUNNING = 'running'
+    SUCCESS = 'success'
+    PARTIAL = 'partial'  # остановлена по бюджету, продолжение в следующий запуск
+    INTERRUPTED = 'interrupted'  # процесс завершился посреди выполнения
+    FAILED = 'failed'
+
+    def __str__(self):
+        return self.value
+
+class TaskRun(db.Model):
+    """Запуск задачи планировщика с контрольной точкой для продолжения"""
+    __tablename__ = 'task_run'
+
+    id = db.Column(db.Integer, primary_key=True)
+    task_name = db.Column(db.String(100), nullable=False, index=True)
+    status = db.Column(db.String(16), nullable=False, default=TaskRunStatusEnum.RUNNING)
+    resumed_from_id = db.Column(db.Integer, db.ForeignKey('task_run.id'))
+
+    cursor = db.Column(db.JSON)  # курсор прогресса (например, оставшиеся id)
+    outcomes = db.Column(db.JSON, default=dict)  # результат по элементам: {id: "ok" | текст ошибки}
+    total = db.Column(db.Integer, default=0)
+    processed = db.Column(db.Integer, default=0)
+    failed = db.Column(db.Integer, default=0)
+    api_calls = db.Column(db.Integer, default=0)
+    error = db.Column(db.String(1024))
+
+    started_at = db.Column(db.DateTime, default=lambda: datetime.now(ZoneInfo("Europe/Moscow")))
+    heartbeat_at = db.Column(db.DateTime, default=lambda: datetime.now(ZoneInfo("Europe/Moscow")))
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # Не более одного выполняющегося запуска задачи: два процесса не начнут ее одновременно
+        db.Index(
+            'uq_task_run_running', 'task_name',
+            unique=True,
+            sqlite_where=db.text("status = 'running'")
+        ),
+    )
+
+    @property
+    def duration(self):
+        """Длительность в секундах"""
+        end = self.finished_at or self.heartbeat_at
+        if not end or not self.started_at:
+            return None
+        return (end - self.started_at).total_seconds()
+
+    @property
+    def items_per_minute(self):
+        duration = self.duration
+        if not duration:
+            return None
+        return round((self.processed or 0) * 60 / duration, 1)
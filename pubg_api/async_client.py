@@ -0,0 +1,88 @@
+# pubg_api/async_client.py
+import asyncio
+import logging
+from typing import Dict, Iterable
+from flask import current_app, has_app_context
+
+from pubg_api.client import PUBGApiClient
+from pubg_api.models import Player, ParsedPlayerStats, MatchData
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPUBGApiClient:
+    """
+    Asyncio-вариант PUBGApiClient.
+
+    Запросы выполняются в потоках поверх того же keep-alive пула соединений
+    и того же общего лимитера, что и у синхронного клиента, поэтому бюджет
+    запросов у них один. Одновременно выполняется не больше concurrency запросов.
+
+    Запросы синхронного клиента ограничены полосами (LANE_CONCURRENCY, общие на процесс),
+    поэтому concurrency не может быть больше лимита полосы /matches: лишние потоки только ждали бы слот
+    """
+
+    DEFAULT_CONCURRENCY = 10
+
+    def __init__(self, concurrency: int = None, blocking: bool = True, **client_kwargs):
+        lane_limit = PUBGApiClient.LANE_CONCURRENCY[PUBGApiClient.UNMETERED]
+        requested = concurrency or self.DEFAULT_CONCURRENCY
+        if requested > lane_limit:
+            logger.warning(
+                f"concurrency={requested} больше лимита полосы /matches ({lane_limit}), используется {lane_limit}. "
+                f"Лимит задается PUBG_API_MATCH_CONCURRENCY"
+            )
+        self.concurrency = min(requested, lane_limit)
+        self.client = PUBGApiClient(
+            pool_size=max(self.concurrency, PUBGApiClient.POOL_SIZE),
+            blocking=blocking,
+            **client_kwargs
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def _call(self, func, *args, **kwargs):
+        app = current_app._get_current_object() if has_app_context() else None
+        async with self._semaphore:
+            return await asyncio.to_thread(self._run, app, func, *args, **kwargs)
+
+    @staticmethod
+    def _run(app, func, *args, **kwargs):
+        # to_thread копирует контекст вызывающего, а с ним и сессию БД контекста приложения.
+        # Каждому потоку нужен свой контекст, иначе потоки делят одну сессию (кеш ошибок API)
+        if app is None:
+            return func(*args, **kwargs)
+        with app.app_context():
+            return func(*args, **kwargs)
+
+    # Получить данные по игроку
+    async def get_player_by_name(self, player_name: str, shard: str = "steam") -> Player:
+        return await self._call(self.client.get_player_by_name, player_name, shard=shard)
+
+    # Получить статистику за все время по id игрока
+    async def get_player_lifetime_stats_by_id(self, player_id: str, shard: str = "steam") -> ParsedPlayerStats:
+        return await self._call(self.client.get_player_lifetime_stats_by_id, player_id, shard=shard)
+
+    # Получить матч по ID
+    async def get_match_by_id(self, match_id: str, shard: str = "steam") -> MatchData:
+        return await self._call(self.client.get_match_by_id, match_id, shard=shard)
+
+    async def gather_matches(self, match_ids: Iterable[str], shard: str = "steam") -> Dict[str, MatchData]:
+        """
+        Параллельно загружает матчи по списку id
+
+        Returns:
+            {match_id: MatchData} для успешно загруженных матчей, ошибки пишутся в лог
+        """
+        ids = list(dict.fromkeys(match_id for match_id in match_ids if match_id))
+        results = await asyncio.gather(
+            *(self.get_match_by_id(match_id, shard=shard) for match_id in ids),
+            return_exceptions=True
+        )
+
+        matches = {}
+        for match_id, result in zip(ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка загрузки матча {match_id}: {str(result)}")
+                continue
+            matches[match_id] = result
+        return matches
@@ -1,102 +1,455 @@
 import os
+import re
 import time
+import random
+import threading
 import requests
-from flask import has_request_context, flash
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Dict, List, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import has_request_context, flash, request
 from dotenv import load_dotenv
-from datetime import datetime
 from models import Player, PlayerStats
+from extensions import json_codec
 
 # Импорт логирования
 from services.admin_log_service import log_admin_action as log
+from services.negative_cache_service import get_cached_error, remember_error
 
 from pubg_api.models import Player, ParsedPlayerStats, MatchData
+from pubg_api.rate_limiter import SharedTokenBucket
+from pubg_api.singleflight import SingleFlight
 
 load_dotenv("secrets.env")
 
 class PUBGApiException(Exception):
+    def __init__(self, message: str = "", status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code  # HTTP-статус ответа API, если он был
+
+class PUBGNotFoundException(PUBGApiException):
+    """API ответил 404 - запрошенных данных не существует"""
+    pass
+
+class PUBGRateLimitException(PUBGApiException):
+    """Квота запросов исчерпана и ждать ее в текущем режиме нельзя"""
     pass
 
 class PUBGApiClient:
-    BASE_URL = "https://api.pubg.com"
-    RATE_LIMIT = 10  # максимум 10 запросов в минуту
+    BASE_URL = os.getenv("PUBG_API_BASE_URL", "https://api.pubg.com")  # можно подменить на локальный стенд
+    RATE_LIMIT = 10  # начальный лимит в минуту, дальше уточняется по заголовкам X-RateLimit-*
     MAX_QUEUE_SIZE = 30 # максимум в очереди
 
-    def __init__(self):
+    MAX_RETRIES = 3  # повторов после ответа 429, 5xx или таймаута чтения
+    RETRY_BACKOFF = 1  # базовая задержка джиттера между повторами, сек.
+
+    PLAYER_NAMES_BATCH = 10  # максимум ников в одном filter[playerNames]
+    PLAYER_IDS_BATCH = 10  # максимум id в одном filter[playerIds]
+    FPP_GAME_MODES = ("solo-fpp", "duo-fpp", "squad-fpp")  # режимы, которые сохраняет ParsedPlayerStats
+
+    PERMANENT_ERROR_STATUSES = (400, 404)  # ответы, которые запоминаются в кеше ошибок
+    RETRY_STATUSES = (500, 502, 503, 504)  # временные сбои API, повторяются фоновыми вызовами
+
+    INTERACTIVE_MAX_WAIT = 0  # веб-запросы не ждут квоту, а сразу получают отказ
+    BACKGROUND_MAX_WAIT = MAX_QUEUE_SIZE * 60 / RATE_LIMIT  # фоновые задачи ждут, пока очередь не переполнена
+
+    POOL_SIZE = int(os.getenv("PUBG_API_POOL_SIZE", 10))  # keep-alive соединений на хост
+    CONNECT_TIMEOUT = 3.05  # сек. на установку соединения
+    READ_TIMEOUT = 15  # сек. на чтение ответа
+
+    # Общий для всех экземпляров пул соединений
+    _session = None
+    _pool_size = 0
+    _session_lock = threading.Lock()
+
+    # Полосы запросов: metered расходует квоту ключа, unmetered (/matches) - нет
+    METERED = "metered"
+    UNMETERED = "unmetered"
+    LANE_CONCURRENCY = {  # одновременных запросов в полосе на процесс
+        METERED: 5,
+        UNMETERED: int(os.getenv("PUBG_API_MATCH_CONCURRENCY", 10))
+    }
+    _UNMETERED_ENDPOINT = re.compile(r"^/shards/[^/]+/matches/")
+    _lane_semaphores = {lane: threading.BoundedSemaphore(limit) for lane, limit in LANE_CONCURRENCY.items()}
+
+    # Схлопывание одинаковых одновременных запросов
+    _single_flight = SingleFlight()
+
+    # Общий лимитер запросов (SQLite token bucket)
+    _rate_limiter = None
+    _rate_limiter_lock = threading.Lock()
+
+    def __init__(self, pool_size: int = None, timeout: tuple = None, blocking: bool = None, max_wait: float = None):
+        """
+        Args:
+            pool_size: размер пула keep-alive соединений
+            timeout: (connect, read) таймауты запроса в секундах
+            blocking: ждать ли квоту. True - фоновый режим, False - отказ без ожидания,
+                None - определяется автоматически (в HTTP-запросе не ждем)
+            max_wait: сколько секунд фоновый режим ждет квоту на один запрос (по умолчанию BACKGROUND_MAX_WAIT)
+        """
         self.api_key = os.getenv("PUBG_API_KEY")
         if not self.api_key:
             raise PUBGApiException("PUBG_API_KEY не задан в .env файле")
 
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
-            "Accept": "application/vnd.api+json"
+            "Accept": "application/vnd.api+json",
+            "Accept-Encoding": "gzip"
         }
-        
-        self.request_timestamps = []
+        self.timeout = timeout or (self.CONNECT_TIMEOUT, self.READ_TIMEOUT)
+        self.session = self._get_session(pool_size or self.POOL_SIZE)
+        self.rate_limiter = self._get_rate_limiter()
+        self.blocking = blocking
+        self.max_wait = max_wait if max_wait is not None else self.BACKGROUND_MAX_WAIT
+        # Сколько запросов к лимитируемым эндпоинтам отправил этот экземпляр (включая повторы после 429)
+        self.metered_calls = 0
+        self._metered_calls_lock = threading.Lock()
+
+    @classmethod
+    def _get_session(cls, pool_size: int) -> requests.Session:
+        """
+        Возвращает общий keep-alive пул соединений к PUBG API (создается один раз на процесс).
+        Если клиенту нужен пул больше текущего, пул расширяется для всех экземпляров
+        """
+        with cls._session_lock:
+            if cls._session is None:
+                cls._session = requests.Session()
+            if pool_size > cls._pool_size:
+                # Запросы, уже идущие через старый адаптер, завершатся на нем
+                adapter = cls._make_adapter(pool_size)
+                cls._session.mount("https://", adapter)
+                cls._session.mount("http://", adapter)
+                cls._pool_size = pool_size
+            return cls._session
 
+    @staticmethod
+    def _make_adapter(pool_size: int) -> HTTPAdapter:
+        # Адаптер повторяет только неудачные подключения (запрос не ушел в API).
+        # Таймауты чтения и 5xx повторяет _get: каждый повтор - отдельный запрос с токеном квоты
+        retry = Retry(
+            total=3,
+            connect=3,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=0.5,
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False
+        )
+        return HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=retry
+        )
+
+
+    @classmethod
+    def _get_rate_limiter(cls) -> SharedTokenBucket:
+        """Общий для всех экземпляров и процессов бюджет запросов к API"""
+        with cls._rate_limiter_lock:
+            if cls._rate_limiter is None:
+                cls._rate_limiter = SharedTokenBucket(capacity=cls.RATE_LIMIT, period=60)
+            return cls._rate_limiter
+
+    def _max_wait(self) -> float:
+        """Сколько можно ждать квоту в текущем режиме"""
+        blocking = self.blocking if self.blocking is not None else not has_request_context()
+        return self.max_wait if blocking else self.INTERACTIVE_MAX_WAIT
 
     def _rate_limit_guard(self):
-        now = datetime.now()
+        max_wait = self._max_wait()
 
-        # Очистим старые таймстемпы (старше 60 секунд)
-        self.request_timestamps = [
-            ts for ts in self.request_timestamps if (now - ts).total_seconds() < 60
-        ]
+        if not self.rate_limiter.acquire(timeout=max_wait):
+            # AJAX-запросы сообщают об ошибке в ответе, иначе сообщение всплывет на следующей странице
+            if has_request_context() and request.headers.get('X-Requested-With') != 'XMLHttpRequest':
+                flash("Лимит запросов к PUBG API исчерпан. Попробуйте позже.", "error")
+            raise PUBGRateLimitException(f"Квота PUBG API исчерпана (ожидание больше {max_wait:.0f} сек.)")
 
-        if len(self.request_timestamps) < self.RATE_LIMIT:
-            # Можно делать запрос
-            self.request_timestamps.append(now)
-            return
 
-        # Если очередь переполнена
-        if len(self.request_timestamps) >= self.RATE_LIMIT + self.MAX_QUEUE_SIZE:
-            if has_request_context():
-                flash("Очередь обновлений переполнена. Попробуйте позже.", "error")
-            raise PUBGApiException("Очередь переполнена")
+    @staticmethod
+    def _header_number(response, name: str):
+        value = response.headers.get(name)
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
 
-        # В очереди, ждём
-        earliest = self.request_timestamps[0]
-        delta = (now - earliest).total_seconds()
-        sleep_time = 60 - delta
+    def _reset_time(self, response) -> float:
+        """Unix-время сброса окна лимита из заголовков ответа"""
+        reset = self._header_number(response, "X-RateLimit-Reset")
+        if reset is None:
+            retry_after = self._header_number(response, "Retry-After")
+            return time.time() + (retry_after if retry_after is not None else 60 / self.RATE_LIMIT)
+        # На случай, если вместо метки времени пришло количество секунд
+        return reset if reset > 1_000_000_000 else time.time() + reset
 
-        if has_request_context():
-            flash(f"[Обновление игровых данных] Вы добавлены в очередь. Примерное время ожидания: {sleep_time:.1f} сек...", "success")
+    def _update_rate_limit(self, response):
+        """Подстраивает лимитер под X-RateLimit-* заголовки ответа"""
+        limit = self._header_number(response, "X-RateLimit-Limit")
+        remaining = self._header_number(response, "X-RateLimit-Remaining")
+        if limit is None and remaining is None:
+            return
 
-        time.sleep(sleep_time)
+        self.rate_limiter.calibrate(
+            limit=int(limit) if limit else None,
+            remaining=int(remaining) if remaining is not None else None,
+            reset_at=self._reset_time(response)
+        )
 
-        # После ожидания снова пробуем
-        self._rate_limit_guard()
+    @classmethod
+    def _lane_for(cls, endpoint: str) -> str:
+        """К какой полосе относится запрос: /matches не расходует квоту API"""
+        return cls.UNMETERED if cls._UNMETERED_ENDPOINT.match(endpoint) else cls.METERED
 
+    def _lane_wait(self):
+        """Сколько ждать свободный слот полосы: веб-запрос - не дольше таймаута чтения, фон - сколько нужно"""
+        return self.READ_TIMEOUT if not self._max_wait() else None
 
-    def _get(self, endpoint: str):
-        self._rate_limit_guard()
+    def _get(self, endpoint: str, params: dict = None, timeout: tuple = None):
         url = f"{self.BASE_URL}{endpoint}"
-        response = requests.get(url, headers=self.headers)
+        lane = self._lane_for(endpoint)
+        metered = lane == self.METERED
+        last_error = None  # временный сбой последней попытки (None - последней был ответ 429)
+
+        for attempt in range(self.MAX_RETRIES + 1):
+            if attempt:
+                if not self._max_wait():
+                    break  # в веб-запросе повторов не ждем
+                # Разносим повторы разных процессов, чтобы они не ударили в API одновременно после сброса
+                time.sleep(random.uniform(0, self.RETRY_BACKOFF * 2 ** attempt))
+
+            # Токен берем до слота полосы, чтобы ожидание квоты не занимало соединение
+            if metered:
+                self._rate_limit_guard()
+
+            semaphore = self._lane_semaphores[lane]
+            if not semaphore.acquire(timeout=self._lane_wait()):
+                raise PUBGApiException(f"Нет свободных соединений к PUBG API ({lane})")
+            if metered:
+                with self._metered_calls_lock:
+                    self.metered_calls += 1
+            try:
+                response = self.session.get(
+                    url,
+                    headers=self.headers,
+                    params=params,
+                    timeout=timeout or self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # Обрыв или таймаут чтения: запрос мог дойти до API, повтор - на общих основаниях
+                last_error = PUBGApiException(f"Ошибка соединения с PUBG API: {e}")
+                continue
+            except requests.RequestException as e:
+                raise PUBGApiException(f"Ошибка соединения с PUBG API: {e}") from e
+            finally:
+                semaphore.release()
+
+            if response.status_code == 429:
+                last_error = None
+                if metered:
+                    # Ждем ровно до сброса окна: лимитер не выдаст токен раньше
+                    self.rate_limiter.pause_until(self._reset_time(response))
+                continue
+
+            if metered:
+                self._update_rate_limit(response)
+
+            if response.status_code in self.RETRY_STATUSES:
+                last_error = PUBGApiException(f"Ошибка при запросе к PUBG API: {response.status_code}", status_code=response.status_code)
+                continue
+
+            if response.status_code == 404:
+                raise PUBGNotFoundException(f"Данные не найдены в PUBG API: {endpoint}", status_code=404)
+            if not response.ok:
+                raise PUBGApiException(f"Ошибка при запросе к PUBG API: {response.status_code}, {response.text}", status_code=response.status_code)
+
+            return json_codec.loads(response.content)
 
-        if response.status_code == 429:
-            raise PUBGApiException("Rate limit exceeded (429)")
-        if not response.ok:
-            raise PUBGApiException(f"Ошибка при запросе к PUBG API: {response.status_code}, {response.text}")
+        if last_error is not None:
+            raise last_error
+        raise PUBGRateLimitException(f"Rate limit exceeded (429) для {endpoint}", status_code=429)
 
-        return response.json()
+    def _coalesce(self, key: tuple, func, *args):
+        """Одинаковые одновременные запросы выполняются один раз, остальные вызовы ждут его результат"""
+        # Веб-запрос не ждет чужой запрос дольше, чем ждал бы свой
+        blocking = bool(self._max_wait())
+        timeout = None if blocking else self._lane_wait() + sum(self.timeout)
+        # Режим ожидания входит в ключ: фоновый вызов не должен получить отказ по квоте,
+        # который веб-запрос получает вместо ожидания
+        try:
+            return self._single_flight.do(key + (blocking,), func, *args, timeout=timeout)
+        except FuturesTimeoutError as e:
+            raise PUBGApiException("Превышено время ожидания ответа PUBG API") from e
+
+    def _cached_call(self, key: tuple, func, *args):
+        """
+        Вызов с кешем постоянных ошибок: если API уже ответил, что таких данных нет,
+        повторный запрос в течение TTL не расходует квоту
+        """
+        cache_key = ":".join(str(part) for part in key)
+        cached = get_cached_error(cache_key)
+        if cached:
+            exception_class = PUBGNotFoundException if cached.status_code == 404 else PUBGApiException
+            raise exception_class(cached.error, status_code=cached.status_code)
+
+        try:
+            return self._coalesce(key, func, *args)
+        except PUBGApiException as e:
+            if e.status_code in self.PERMANENT_ERROR_STATUSES:
+                remember_error(cache_key, e, status_code=e.status_code)
+            raise
+
+    @classmethod
+    def coalescing_stats(cls) -> dict:
+        """Сколько вызовов клиента было схлопнуто с уже выполняющимися запросами"""
+        return cls._single_flight.stats()
 
     # Получить данные по игроку
     def get_player_by_name(self, player_name: str, shard: str = "steam") -> Player:
-        endpoint = f"/shards/{shard}/players?filter[playerNames]={player_name}"
-        response = self._get(endpoint)
+        return self._cached_call(("player", shard, player_name), self._fetch_player_by_name, player_name, shard)
+
+    def _fetch_player_by_name(self, player_name: str, shard: str) -> Player:
+        endpoint = f"/shards/{shard}/players"
+        try:
+            response = self._get(endpoint, params={"filter[playerNames]": player_name})
+        except PUBGNotFoundException:
+            response = {}
         data = response.get("data")
         if not data:
-            raise PUBGApiException(f"Игрок с именем '{player_name}' не найден.")
+            raise PUBGNotFoundException(f"Игрок с именем '{player_name}' не найден.", status_code=404)
         return Player(data[0])
+
+    # Получить данные сразу по нескольким игрокам (до 10 ников за запрос)
+    def get_players_by_names(self, player_names: List[str], shard: str = "steam", max_calls: int = None) -> Tuple[Dict[str, Player], List[str]]:
+        """
+        Пакетный поиск игроков по никам
+
+        Args:
+            max_calls: сколько запросов можно сделать (деление пачек с ненайденными никами
+                тоже расходует запросы). Ники, до которых не дошла очередь, не попадают ни в один из списков
+
+        Returns:
+            (найденные игроки {ник: Player}, список ненайденных ников)
+        """
+        names = list(dict.fromkeys(name for name in player_names if name))  # без дублей, с сохранением порядка
+        # Ники, которые API недавно не нашел, не запрашиваем (тот же ключ, что у get_player_by_name)
+        known_missing = [name for name in names if get_cached_error(f"player:{shard}:{name}")]
+        to_fetch = [name for name in names if name not in known_missing]
+        call_limit = self.metered_calls + max_calls if max_calls is not None else None
+        players = {}
+        unchecked = []
+
+        for i in range(0, len(to_fetch), self.PLAYER_NAMES_BATCH):
+            found, skipped = self._get_players_chunk(to_fetch[i:i + self.PLAYER_NAMES_BATCH], shard, call_limit)
+            players.update(found)
+            unchecked.extend(skipped)
+
+        not_found = [name for name in names if name not in players and name not in unchecked]
+        for name in not_found:
+            if name not in known_missing:
+                remember_error(f"player:{shard}:{name}", f"Игрок {name} не найден", status_code=404)
+        return players, not_found
+
+    def _get_players_chunk(self, names: List[str], shard: str, call_limit: int = None) -> Tuple[Dict[str, Player], List[str]]:
+        """Returns: (найденные игроки, ники, которые не проверены из-за лимита запросов)"""
+        if call_limit is not None and self.metered_calls >= call_limit:
+            return {}, names
+
+        endpoint = f"/shards/{shard}/players"
+        try:
+            response = self._get(endpoint, params={"filter[playerNames]": ",".join(names)})
+        except PUBGNotFoundException:
+            # 404 на пачку - делим пополам, чтобы отсеять ненайденные ники за log(n) запросов
+            if len(names) == 1:
+                return {}, []
+            middle = len(names) // 2
+            left, left_skipped = self._get_players_chunk(names[:middle], shard, call_limit)
+            right, right_skipped = self._get_players_chunk(names[middle:], shard, call_limit)
+            return {**left, **right}, left_skipped + right_skipped
+
+        returned = {}
+        for item in response.get("data") or []:
+            player = Player(item)
+            if player.name:
+                returned[player.name.lower()] = player
+
+        return {name: returned[name.lower()] for name in names if name.lower() in returned}, []
     
+    # Получить данные сразу по нескольким игрокам по id (до 10 id за запрос)
+    def get_players_by_ids(self, player_ids: List[str], shard: str = "steam") -> Dict[str, Player]:
+        """
+        Пакетная загрузка игроков по pubg_id (в том числе списков последних матчей)
+
+        Returns:
+            {pubg_id: Player} для игроков, по которым API вернул данные
+        """
+        ids = list(dict.fromkeys(player_id for player_id in player_ids if player_id))
+        players = {}
+
+        for i in range(0, len(ids), self.PLAYER_IDS_BATCH):
+            endpoint = f"/shards/{shard}/players"
+            try:
+                response = self._get(endpoint, params={"filter[playerIds]": ",".join(ids[i:i + self.PLAYER_IDS_BATCH])})
+            except PUBGNotFoundException:
+                continue
+
+            for item in response.get("data") or []:
+                player = Player(item)
+                if player.id:
+                    players[player.id] = player
+
+        return players
+
     # Получить статистику за все время по нику игрока
     def get_player_lifetime_stats_by_id(self, player_id: str, shard="steam") -> PlayerStats:
+        return self._cached_call(("lifetime_stats", shard, player_id), self._fetch_player_lifetime_stats_by_id, player_id, shard)
+
+    def _fetch_player_lifetime_stats_by_id(self, player_id: str, shard: str) -> ParsedPlayerStats:
         endpoint = f"/shards/{shard}/players/{player_id}/seasons/lifetime"
         data = self._get(endpoint)
         return ParsedPlayerStats(data)
 
 
+    # Получить статистику за все время сразу по нескольким игрокам
+    def get_players_lifetime_stats_by_ids(self, player_ids: List[str], shard: str = "steam", game_modes: tuple = None) -> Dict[str, ParsedPlayerStats]:
+        """
+        Пакетная загрузка lifetime-статистики: один запрос на 10 игроков и режим игры
+
+        Returns:
+            {pubg_id: ParsedPlayerStats} для игроков, по которым API вернул данные
+        """
+        ids = list(dict.fromkeys(player_id for player_id in player_ids if player_id))
+        game_mode_stats = {}
+
+        for i in range(0, len(ids), self.PLAYER_IDS_BATCH):
+            chunk = ids[i:i + self.PLAYER_IDS_BATCH]
+            for game_mode in game_modes or self.FPP_GAME_MODES:
+                endpoint = f"/shards/{shard}/seasons/lifetime/gameMode/{game_mode}/players"
+                try:
+                    response = self._get(endpoint, params={"filter[playerIds]": ",".join(chunk)})
+                except PUBGNotFoundException:
+                    continue
+
+                for item in response.get("data") or []:
+                    player_id = item.get("relationships", {}).get("player", {}).get("data", {}).get("id")
+                    if not player_id:
+                        continue
+                    modes = item.get("attributes", {}).get("gameModeStats", {})
+                    game_mode_stats.setdefault(player_id, {}).update(modes)
+
+        return {
+            player_id: ParsedPlayerStats({"data": {"attributes": {"gameModeStats": modes}}})
+            for player_id, modes in game_mode_stats.items()
+        }
+
     # Получить матч по ID
     def get_match_by_id(self, match_id, shard="steam") -> MatchData:
+        return self._cached_call(("match", shard, match_id), self._fetch_match_by_id, match_id, shard)
+
+    def _fetch_match_by_id(self, match_id: str, shard: str) -> MatchData:
         endpoint = f"/shards/{shard}/matches/{match_id}"
         data = self._get(endpoint)
         return MatchData(data)
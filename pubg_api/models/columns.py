@@ -0,0 +1,96 @@
+from typing import Dict, List, Tuple
+import numpy as np
+
+
+class ParticipantColumns:
+    """
+    Колоночное представление участников матча: по массиву NumPy на показатель,
+    i-й элемент каждого массива относится к i-му участнику MatchData.participants
+    """
+
+    __slots__ = (
+        "names", "account_ids", "roster_ids", "team_ids", "team_codes",
+        "kills", "assists", "damage", "headshots", "dbnos", "revives",
+        "win_place", "team_rank", "walk_distance", "ride_distance", "time_survived"
+    )
+
+    def __init__(self, participants: list):
+        self.names = np.array([participant.name or "Unknown" for participant in participants], dtype=object)
+        self.account_ids = np.array([participant.player_id for participant in participants], dtype=object)
+        self.roster_ids = np.array([participant.roster_id for participant in participants], dtype=object)
+        # Номер команды участника (индекс в team_ids) для группировки через bincount; -1 - без команды
+        codes = {}
+        self.team_codes = np.fromiter(
+            (codes.setdefault(participant.roster_id, len(codes)) if participant.roster_id else -1 for participant in participants),
+            dtype=np.int32, count=len(participants)
+        )
+        self.team_ids = list(codes)
+
+        stats = [participant.stats for participant in participants]
+        self.kills = np.fromiter((s.kills for s in stats), dtype=np.int32, count=len(stats))
+        self.assists = np.fromiter((s.assists for s in stats), dtype=np.int32, count=len(stats))
+        self.damage = np.fromiter((s.damage_dealt for s in stats), dtype=np.float64, count=len(stats))
+        self.headshots = np.fromiter((s.headshot_kills for s in stats), dtype=np.int32, count=len(stats))
+        self.dbnos = np.fromiter((s.dbnos for s in stats), dtype=np.int32, count=len(stats))
+        self.revives = np.fromiter((s.revives for s in stats), dtype=np.int32, count=len(stats))
+        self.win_place = np.fromiter((s.win_place for s in stats), dtype=np.int32, count=len(stats))
+        self.team_rank = np.fromiter((s.team_rank for s in stats), dtype=np.int32, count=len(stats))
+        self.walk_distance = np.fromiter((s.walk_distance for s in stats), dtype=np.float64, count=len(stats))
+        self.ride_distance = np.fromiter((s.ride_distance for s in stats), dtype=np.float64, count=len(stats))
+        self.time_survived = np.fromiter((s.time_survived for s in stats), dtype=np.float64, count=len(stats))
+
+    def __len__(self):
+        return len(self.names)
+
+    def top_indices(self, count: int) -> np.ndarray:
+        """Индексы лучших игроков: больше убийств, при равенстве - больше урона"""
+        # lexsort устойчива и сортирует по последнему ключу в первую очередь
+        order = np.lexsort((-self.damage, -self.kills))
+        return order[:count]
+
+    def team_totals(self) -> List[Dict]:
+        """Сумма убийств и урона, число игроков по командам, от лучшего места к худшему"""
+        if not self.team_ids:
+            return []
+
+        has_team = self.team_codes >= 0
+        codes = self.team_codes[has_team]
+        teams = len(self.team_ids)
+        kills = np.bincount(codes, weights=self.kills[has_team], minlength=teams)
+        damage = np.bincount(codes, weights=self.damage[has_team], minlength=teams)
+        members = np.bincount(codes, minlength=teams)
+        # Место команды у всех ее участников одинаковое
+        ranks = np.zeros(teams, dtype=np.int32)
+        ranks[codes] = self.team_rank[has_team]
+
+        order = np.lexsort((-kills, np.where(ranks > 0, ranks, np.iinfo(np.int32).max)))
+        return [
+            {
+                "roster_id": self.team_ids[i],
+                "rank": int(ranks[i]),
+                "kills": int(kills[i]),
+                "damage": round(float(damage[i]), 1),
+                "members": int(members[i])
+            }
+            for i in order
+        ]
+
+    def percentile_ranks(self, index: int) -> Dict[str, float]:
+        """Доля участников матча (в %), у которых показатель не выше, чем у игрока index"""
+        columns = {
+            "kills": self.kills,
+            "damage": self.damage,
+            "time_survived": self.time_survived,
+            "distance": self.walk_distance + self.ride_distance
+        }
+        return {
+            name: round(float(np.count_nonzero(values <= values[index]) * 100 / len(values)), 1)
+            for name, values in columns.items()
+        }
+
+    def percentiles(self, column: str, q: Tuple[float, ...] = (50, 90, 99)) -> Dict[float, float]:
+        """Перцентили показателя по матчу, например {50: медиана, 90: ..., 99: ...}"""
+        values = getattr(self, column)
+        if not len(values):
+            return {}
+        return dict(zip(q, (round(float(value), 2) for value in np.percentile(values, q))))
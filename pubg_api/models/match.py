@@ -1,9 +1,12 @@
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, field
 from typing import Dict, List, Optional, Tuple
 import logging
+import threading
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
+from .columns import ParticipantColumns
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -26,13 +29,77 @@ class PlayerMatchStats:
     team_rank: int = 0  # место команды
 
 
+class _RecordMixin:
+    """Доступ к полям записи как к словарю (get / []) для кода и шаблонов, работавших со словарями"""
+    __slots__ = ()
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+@dataclass(slots=True)
+class ParticipantStats(_RecordMixin):
+    """Статистика участника матча"""
+    kills: int = 0
+    assists: int = 0
+    damage_dealt: float = 0.0
+    headshot_kills: int = 0
+    longest_kill: float = 0.0
+    revives: int = 0
+    ride_distance: float = 0.0
+    walk_distance: float = 0.0
+    time_survived: float = 0
+    win_place: int = 0
+    death_type: Optional[str] = None
+    vehicle_destroys: int = 0
+    dbnos: int = 0
+    team_rank: int = 0
+
+
+@dataclass(slots=True)
+class Participant(_RecordMixin):
+    """Участник матча"""
+    id: str
+    type: str = "participant"
+    player_id: Optional[str] = None
+    name: Optional[str] = None
+    roster_id: Optional[str] = None
+    stats: ParticipantStats = field(default_factory=ParticipantStats)
+
+
+@dataclass(slots=True)
+class Roster(_RecordMixin):
+    """Команда в матче"""
+    id: str
+    type: str = "roster"
+    won: bool = False
+    rank: int = 0
+    team_id: Optional[int] = None
+    participants: List[str] = field(default_factory=list)  # id участников
+
+
 class MatchData:
-    def __init__(self, api_data: dict):
+    def __init__(self, api_data: dict, keep_raw: bool = True, lazy: bool = False):
         """
         Полная модель матча из PUBG API
         
         Args:
             api_data: Сырой JSON-ответ от API /matches/{match_id}
+            keep_raw: хранить исходный JSON после разбора (нужен для сохранения матча в БД)
+            lazy: сразу разобрать только заголовок матча (карта, режим, дата),
+                  а команды, участников и индексы - при первом обращении к ним
         """
         if not isinstance(api_data, dict):
             raise ValueError("Input must be a dictionary")
@@ -41,10 +108,16 @@ class MatchData:
         self._raw_data = api_data
         self._data = api_data.get("data", {})  # <-- сюда переносим
         self._included = api_data.get("included", [])  # included лежит на верхнем уровне
+        self._keep_raw = keep_raw
+        self._parsed = False
+        self._parse_lock = threading.Lock()
         self._parse_data()
 
+        if not lazy:
+            self._ensure_parsed()
+
     def _parse_data(self):
-        """Основной метод парсинга данных"""
+        """Разбор заголовка матча; команды и участники разбираются в _ensure_parsed"""
         data = self._data  # теперь используем это
         
         # Основные поля матча
@@ -64,20 +137,54 @@ class MatchData:
         self.title_id = attributes.get("titleId", "")
         
         # Инициализация коллекций
-        self.rosters = []
-        self.participants = []
+        self._rosters = []
+        self._participants = []
         self.assets = []
         self.telemetry_url = None
+
+        # Индексы для поиска без перебора участников
+        self._by_name = {}  # ник в нижнем регистре -> участник
+        self._by_account = {}  # account id -> участник
+        self._by_participant_id = {}  # id участника -> участник
+        self._roster_members = {}  # id команды -> список участников
+        self._positions = {}  # id участника -> позиция в self.participants (и в колонках)
+        self._winner = None
+        self._columns = None  # колоночное представление, строится при первом обращении
         
         # Обработка связей
         relationships = data.get("relationships", {})
         self._process_relationships(relationships)
-        
-        # Обработка включенных данных
-        self._process_included(self._included)
-        
-        # Связывание данных
-        self._link_team_ranks()
+
+    def _ensure_parsed(self):
+        """Разбирает команды и участников, если это еще не сделано"""
+        if self._parsed:
+            return
+
+        # Матч из кеша может читаться из нескольких потоков
+        with self._parse_lock:
+            if self._parsed:
+                return
+
+            # Обработка включенных данных
+            self._process_included(self._included)
+
+            # Связывание данных
+            self._build_indexes()
+            self._link_team_ranks()
+            self._parsed = True
+
+        if not self._keep_raw:
+            self.drop_raw_data()
+
+    @property
+    def participants(self) -> List[Participant]:
+        self._ensure_parsed()
+        return self._participants
+
+    @property
+    def rosters(self) -> List[Roster]:
+        self._ensure_parsed()
+        return self._rosters
 
     def _format_created_at(self, iso_str):
         """Форматирование даты"""
@@ -118,84 +225,126 @@ class MatchData:
     def _process_roster(self, item: dict, attributes: dict, relationships: dict):
         """Обработка данных команды/роста"""
         roster_stats = attributes.get("stats", {})
-        
-        roster = {
-            "id": item.get("id"),
-            "type": item.get("type"),
-            "won": roster_stats.get("won", False),
-            "rank": roster_stats.get("rank", 0),
-            "team_id": roster_stats.get("teamId"),
-            "participants": []
-        }
-        self.rosters.append(roster)
+        # В API признак победы лежит в attributes.won строкой "true" / "false"
+        won = attributes.get("won", roster_stats.get("won", False))
+        members = relationships.get("participants", {}).get("data", [])
+
+        roster = Roster(
+            id=item.get("id"),
+            type=item.get("type"),
+            won=won in (True, "true"),
+            rank=roster_stats.get("rank", 0),
+            team_id=roster_stats.get("teamId"),
+            participants=[member.get("id") for member in members if isinstance(member, dict)]
+        )
+        self._rosters.append(roster)
 
     def _process_participant(self, item: dict, attributes: dict, relationships: dict):
         """Обработка данных участника"""
         participant_stats = attributes.get("stats", {})
         
-        participant = {
-            "id": item.get("id"),
-            "type": item.get("type"),
-            "player_id": participant_stats.get("playerId"),
-            "name": participant_stats.get("name"),
-            "roster_id": relationships.get("roster", {}).get("data", {}).get("id"),
-            "stats": {
-                "kills": participant_stats.get("kills", 0),
-                "assists": participant_stats.get("assists", 0),
-                "damage_dealt": participant_stats.get("damageDealt", 0.0),
-                "headshot_kills": participant_stats.get("headshotKills", 0),
-                "longest_kill": participant_stats.get("longestKill", 0.0),
-                "revives": participant_stats.get("revives", 0),
-                "ride_distance": participant_stats.get("rideDistance", 0.0),
-                "walk_distance": participant_stats.get("walkDistance", 0.0),
-                "time_survived": participant_stats.get("timeSurvived", 0),
-                "win_place": participant_stats.get("winPlace", 0),
-                "death_type": participant_stats.get("deathType"),
-                "vehicle_destroys": participant_stats.get("vehicleDestroys", 0),
-                "dbnos": participant_stats.get("DBNOs", 0)
-            }
-        }
-        self.participants.append(participant)
+        participant = Participant(
+            id=item.get("id"),
+            type=item.get("type"),
+            player_id=participant_stats.get("playerId"),
+            name=participant_stats.get("name"),
+            roster_id=relationships.get("roster", {}).get("data", {}).get("id"),
+            stats=ParticipantStats(
+                kills=participant_stats.get("kills", 0),
+                assists=participant_stats.get("assists", 0),
+                damage_dealt=participant_stats.get("damageDealt", 0.0),
+                headshot_kills=participant_stats.get("headshotKills", 0),
+                longest_kill=participant_stats.get("longestKill", 0.0),
+                revives=participant_stats.get("revives", 0),
+                ride_distance=participant_stats.get("rideDistance", 0.0),
+                walk_distance=participant_stats.get("walkDistance", 0.0),
+                time_survived=participant_stats.get("timeSurvived", 0),
+                win_place=participant_stats.get("winPlace", 0),
+                death_type=participant_stats.get("deathType"),
+                vehicle_destroys=participant_stats.get("vehicleDestroys", 0),
+                dbnos=participant_stats.get("DBNOs", 0)
+            )
+        )
+        self._participants.append(participant)
+
+    def _build_indexes(self):
+        """Строит индексы участников один раз при разборе матча"""
+        for position, participant in enumerate(self._participants):
+            self._by_participant_id[participant.id] = participant
+            self._positions[participant.id] = position
+            if participant.name:
+                self._by_name.setdefault(participant.name.lower(), participant)
+            if participant.player_id:
+                self._by_account.setdefault(participant.player_id, participant)
+
+        for roster in self._rosters:
+            members = [self._by_participant_id[member_id] for member_id in roster.participants if member_id in self._by_participant_id]
+            # Участник в API не ссылается на команду - берем связь из состава команды
+            for participant in members:
+                participant.roster_id = participant.roster_id or roster.id
+            self._roster_members[roster.id] = members
+            if roster.won and self._winner is None:
+                self._winner = roster
 
     def _link_team_ranks(self):
         """Связываем ранги команд с игроками"""
-        roster_ranks = {roster["id"]: roster.get("rank", 0) for roster in self.rosters}
+        roster_ranks = {roster.id: roster.rank for roster in self._rosters}
         
-        for participant in self.participants:
-            if "stats" in participant:
-                participant["stats"]["team_rank"] = roster_ranks.get(participant["roster_id"], 0)
+        for participant in self._participants:
+            participant.stats.team_rank = roster_ranks.get(participant.roster_id, 0)
+
+    def get_participant(self, player_name: str) -> Optional[Participant]:
+        """Участник по нику (без учета регистра)"""
+        if not player_name:
+            return None
+        self._ensure_parsed()
+        return self._by_name.get(player_name.lower())
+
+    def get_participant_by_account(self, player_id: str) -> Optional[Participant]:
+        """Участник по account id"""
+        self._ensure_parsed()
+        return self._by_account.get(player_id)
+
+    def get_roster_members(self, roster_id: str) -> List[Participant]:
+        """Участники команды"""
+        self._ensure_parsed()
+        return self._roster_members.get(roster_id, [])
+
+    def _to_player_match_stats(self, participant: Participant) -> Optional[PlayerMatchStats]:
+        stats = participant.stats
+        try:
+            return PlayerMatchStats(
+                kills=stats.get("kills", 0),
+                assists=stats.get("assists", 0),
+                damage_dealt=stats.get("damage_dealt", 0.0),
+                headshot_kills=stats.get("headshot_kills", 0),
+                longest_kill=stats.get("longest_kill", 0.0),
+                revives=stats.get("revives", 0),
+                ride_distance=stats.get("ride_distance", 0.0),
+                walk_distance=stats.get("walk_distance", 0.0),
+                time_survived=stats.get("time_survived", 0),
+                win_place=stats.get("win_place", 0),
+                weapons_acquired=stats.get("weapons_acquired", 0),
+                death_type=stats.get("death_type"),
+                vehicle_destroys=stats.get("vehicle_destroys", 0),
+                dbnos=stats.get("dbnos", 0),
+                team_rank=stats.get("team_rank", 0)
+            )
+        except Exception as e:
+            logger.error(f"Failed to create PlayerMatchStats: {str(e)}")
+            return None
 
     def get_detailed_player_stats(self, player_name: str) -> Optional[PlayerMatchStats]:
-        """Получение детальной статистики игрока"""
-        for participant in self.participants:
-            if participant.get("name") == player_name:
-                stats = participant.get("stats", {})
-                try:
-                    return PlayerMatchStats(
-                        kills=stats.get("kills", 0),
-                        assists=stats.get("assists", 0),
-                        damage_dealt=stats.get("damage_dealt", 0.0),
-                        headshot_kills=stats.get("headshot_kills", 0),
-                        longest_kill=stats.get("longest_kill", 0.0),
-                        revives=stats.get("revives", 0),
-                        ride_distance=stats.get("ride_distance", 0.0),
-                        walk_distance=stats.get("walk_distance", 0.0),
-                        time_survived=stats.get("time_survived", 0),
-                        win_place=stats.get("win_place", 0),
-                        weapons_acquired=stats.get("weapons_acquired", 0),
-                        death_type=stats.get("death_type"),
-                        vehicle_destroys=stats.get("vehicle_destroys", 0),
-                        dbnos=stats.get("dbnos", 0),
-                        team_rank=stats.get("team_rank", 0)
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to create PlayerMatchStats: {str(e)}")
-                    return None
-        return None
+        """Получение детальной статистики игрока по нику (без учета регистра)"""
+        participant = self.get_participant(player_name)
+        if not participant:
+            return None
+        return self._to_player_match_stats(participant)
 
     def get_player_performance_summary(self, player_id: str) -> Optional[Dict]:
-        """Сводка производительности игрока"""
-        stats = self.get_detailed_player_stats(player_id)
+        """Сводка производительности игрока (по account id или нику)"""
+        participant = self.get_participant_by_account(player_id) or self.get_participant(player_id)
+        stats = self._to_player_match_stats(participant) if participant else None
         if not stats:
             return None
 
@@ -224,33 +373,38 @@ class MatchData:
         except:
             return "0:00"
 
+    @property
+    def columns(self) -> ParticipantColumns:
+        """Показатели участников массивами NumPy для векторных расчетов (строится один раз)"""
+        if self._columns is None:
+            self._columns = ParticipantColumns(self.participants)
+        return self._columns
+
     def get_top_players(self, count: int = 5) -> List[Tuple[str, int]]:
-        """Топ игроков по убийствам"""
-        players = []
-        for participant in self.participants:
-            stats = participant.get("stats", {})
-            players.append((
-                participant.get("name", "Unknown"),
-                stats.get("kills", 0),
-                stats.get("damage_dealt", 0)
-            ))
-        
-        players.sort(key=lambda x: (-x[1], -x[2]))
-        return [(name, kills) for name, kills, _ in players[:count]]
+        """Топ игроков по убийствам (при равенстве - по урону)"""
+        columns = self.columns
+        return [(columns.names[i], int(columns.kills[i])) for i in columns.top_indices(count)]
+
+    def get_team_totals(self) -> List[Dict]:
+        """Убийства и урон по командам, от лучшего места к худшему"""
+        return self.columns.team_totals()
 
-    def get_winner(self) -> Optional[Dict]:
+    def get_player_percentiles(self, player_name: str) -> Optional[Dict[str, float]]:
+        """Место игрока среди участников матча в перцентилях (убийства, урон, время жизни, дистанция)"""
+        participant = self.get_participant(player_name)
+        if not participant:
+            return None
+        return self.columns.percentile_ranks(self._positions[participant.id])
+
+    def get_winner(self) -> Optional[Roster]:
         """Победившая команда"""
-        for roster in self.rosters:
-            if roster.get("won"):
-                return roster
-        return None
+        self._ensure_parsed()
+        return self._winner
 
-    def get_player_stats(self, player_id: str) -> Optional[Dict]:
+    def get_player_stats(self, player_id: str) -> Optional[ParticipantStats]:
         """Статистика игрока"""
-        for participant in self.participants:
-            if participant.get("player_id") == player_id:
-                return participant.get("stats")
-        return None
+        participant = self.get_participant_by_account(player_id)
+        return participant.stats if participant else None
 
     def to_dict(self) -> Dict:
         """Сериализация в словарь"""
@@ -265,8 +419,8 @@ class MatchData:
             "season_state": self.season_state,
             "shard_id": self.shard_id,
             "telemetry_url": self.telemetry_url,
-            "rosters": self.rosters,
-            "participants": self.participants
+            "rosters": [roster.to_dict() for roster in self.rosters],
+            "participants": [participant.to_dict() for participant in self.participants]
         }
 
     @classmethod
@@ -275,6 +429,13 @@ class MatchData:
         return cls(json_data)
 
     @property
-    def raw_data(self) -> dict:
-        """Оригинальные данные API"""
-        return self._raw_data
\ No newline at end of file
+    def raw_data(self) -> Optional[dict]:
+        """Оригинальные данные API (None, если они уже освобождены)"""
+        return self._raw_data
+
+    def drop_raw_data(self):
+        """Освобождает исходный JSON: в памяти остаются только разобранные записи"""
+        self._ensure_parsed()
+        self._raw_data = None
+        self._data = None
+        self._included = None
\ No newline at end of file
@@ -1,63 +1,192 @@
 # pubg_api/queue_worker.py
+import heapq
 import itertools
+import logging
 import threading
-import queue
 import time
-from datetime import datetime
+from collections import deque
+from concurrent.futures import Future
 
-class APIQueueWorker(threading.Thread):
-    def __init__(self, client, rate_limit=10, max_queue_size=50):
-        super().__init__(daemon=True)
+logger = logging.getLogger(__name__)
+
+
+class Priority:
+    """Классы приоритета задач: меньше - раньше"""
+    INTERACTIVE = 0  # пользователь ждет результат на странице
+    BACKGROUND = 10  # плановые обновления
+
+
+class APIQueueFull(Exception):
+    pass
+
+
+class TaskDeadlineExceeded(Exception):
+    pass
+
+
+class _Task:
+    __slots__ = ("func", "args", "kwargs", "future", "app", "deadline", "priority", "dedup_key", "enqueued_at")
+
+    def __init__(self, func, args, kwargs, future, app, deadline, priority, dedup_key):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.app = app
+        self.deadline = deadline
+        self.priority = priority
+        self.dedup_key = dedup_key
+        self.enqueued_at = time.monotonic()
+
+
+class APIQueueWorker:
+    """
+    Пул из N потоков для задач, обращающихся к PUBG API.
+
+    - add_task возвращает concurrent.futures.Future (можно отменить, пока задача в очереди);
+    - у задачи может быть дедлайн: не начатая вовремя задача завершается TaskDeadlineExceeded;
+    - задачи с одинаковым dedup_key не дублируются: возвращается Future уже ожидающей задачи,
+      а более приоритетный дубль повышает ее приоритет;
+    - квоту все потоки берут из общего лимитера клиента, а один поток всегда
+      зарезервирован под интерактивные задачи, чтобы фоновые их не блокировали.
+    """
+
+    def __init__(self, client=None, workers: int = 4, max_queue_size: int = 50, app=None):
         self.client = client
-        self.rate_limit = rate_limit
+        self.app = app  # Flask-приложение по умолчанию для контекста задач
+        self.workers = max(workers, 2)
         self.max_queue_size = max_queue_size
-        self.task_queue = queue.PriorityQueue(maxsize=max_queue_size)
-        self.last_requests = []
         self.counter = itertools.count()
 
-    def run(self):
-        while True:
-            try:
-                priority, count, task_data = self.task_queue.get()
-                func, args, kwargs, result_queue = task_data
+        self._heap = []  # (priority, порядковый номер, _Task); после повышения приоритета старая запись остается и пропускается
+        self._queued = 0  # задач в очереди (без устаревших записей кучи)
+        self._by_key = {}  # dedup_key -> ожидающая _Task
+        self._cond = threading.Condition()
+        self._threads = []
+        self._wait_times = deque(maxlen=1000)  # сколько задачи ждали в очереди, сек.
+        self._stats = {"completed": 0, "failed": 0, "cancelled": 0, "expired": 0, "deduplicated": 0}
+
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                # Поток 0 берет только интерактивные задачи
+                thread = threading.Thread(
+                    target=self._run,
+                    args=(index == 0,),
+                    name=f"api-worker-{index}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def is_alive(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def add_task(self, func, *args, priority: int = Priority.BACKGROUND, deadline: float = None, app=None,
+                 dedup_key=None, **kwargs) -> Future:
+        """
+        Ставит задачу в очередь
 
-                print(f"[WORKER] Выполняю задачу: {func.__name__} с args={args} kwargs={kwargs}")
+        Args:
+            priority: класс приоритета (Priority.INTERACTIVE / Priority.BACKGROUND)
+            deadline: сколько секунд задача может ждать начала выполнения
+            app: Flask-приложение, в контексте которого выполнить задачу
+            dedup_key: ключ задачи; если такая задача уже ждет в очереди, возвращается ее Future
+        """
+        with self._cond:
+            existing = self._by_key.get(dedup_key) if dedup_key is not None else None
+            if existing is not None and not existing.future.cancelled():
+                if priority < existing.priority:
+                    # Старая запись в куче станет устаревшей и будет пропущена
+                    existing.priority = priority
+                    heapq.heappush(self._heap, (priority, next(self.counter), existing))
+                    self._cond.notify_all()
+                self._stats["deduplicated"] += 1
+                return existing.future
 
-                self._enforce_rate_limit()
+            if self._queued >= self.max_queue_size:
+                raise APIQueueFull("Очередь запросов к PUBG API переполнена")
 
-                try:
-                    app = args[0]  # Берём app из переданных аргументов
-                    with app.app_context():
-                        print(f"[WORKER] Запускаю функцию {func.__name__}")
-                        result = func(*args, **kwargs)
-                        print(f"[WORKER] функция {result}")
-                        print(f"[WORKER] Задача {func.__name__} выполнена успешно")
-                        result_queue.put((result, None))
-                except Exception as e:
-                    print(f"[WORKER] Ошибка в задаче {func.__name__}: {e}")
-                    result_queue.put((None, e))
+            task = _Task(
+                func, args, kwargs, Future(),
+                app or self.app,
+                time.monotonic() + deadline if deadline is not None else None,
+                priority, dedup_key
+            )
+            heapq.heappush(self._heap, (priority, next(self.counter), task))
+            self._queued += 1
+            if dedup_key is not None:
+                self._by_key[dedup_key] = task
+            self._cond.notify_all()
 
-                self.task_queue.task_done()
+        return task.future
 
+    def _next_task(self, interactive_only: bool):
+        """Берет из очереди самую приоритетную задачу (вызывается под self._cond)"""
+        while self._heap:
+            priority, _, task = self._heap[0]
+            if priority != task.priority:
+                heapq.heappop(self._heap)  # запись до повышения приоритета
+                continue
+            if interactive_only and priority > Priority.INTERACTIVE:
+                return None
+            heapq.heappop(self._heap)
+            self._queued -= 1
+            if task.dedup_key is not None and self._by_key.get(task.dedup_key) is task:
+                del self._by_key[task.dedup_key]
+
+            if not task.future.set_running_or_notify_cancel():
+                self._stats["cancelled"] += 1
+                continue
+            if task.deadline is not None and time.monotonic() > task.deadline:
+                self._stats["expired"] += 1
+                task.future.set_exception(TaskDeadlineExceeded(f"Задача {task.func.__name__} не начата до дедлайна"))
+                continue
+            return task
+        return None
+
+    def _run(self, interactive_only: bool):
+        while True:
+            with self._cond:
+                task = self._next_task(interactive_only)
+                while task is None:
+                    self._cond.wait()
+                    task = self._next_task(interactive_only)
+                self._wait_times.append(time.monotonic() - task.enqueued_at)
+
+            logger.debug(f"Выполняю задачу {task.func.__name__}")
+            try:
+                if task.app is not None:
+                    with task.app.app_context():
+                        result = task.func(*task.args, **task.kwargs)
+                else:
+                    result = task.func(*task.args, **task.kwargs)
             except Exception as e:
-                print(f"Ошибка в worker: {e}")
-
-    def _enforce_rate_limit(self):
-        now = datetime.now()
-        self.last_requests = [
-            ts for ts in self.last_requests if (now - ts).total_seconds() < 60
-        ]
-
-        if len(self.last_requests) >= self.rate_limit:
-            earliest = self.last_requests[0]
-            sleep_time = 60 - (now - earliest).total_seconds()
-            time.sleep(max(sleep_time, 0))
-
-        self.last_requests.append(datetime.now())
-
-    def add_task(self, func, *args, priority=1, **kwargs):
-        result_queue = queue.Queue()
-        count = next(self.counter)
-        task_data = (func, args, kwargs, result_queue)
-        self.task_queue.put((priority, count, task_data))
-        return result_queue
+                logger.warning(f"Ошибка в задаче {task.func.__name__}: {e}")
+                task.future.set_exception(e)
+                outcome = "failed"
+            else:
+                task.future.set_result(result)
+                outcome = "completed"
+
+            with self._cond:
+                self._stats[outcome] += 1
+
+    def qsize(self) -> int:
+        """Количество задач, ожидающих в очереди"""
+        with self._cond:
+            return self._queued
+
+    def stats(self) -> dict:
+        """Счетчики задач и время ожидания в очереди (p50/p99, сек.)"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queued"] = self._queued
+            waits = sorted(self._wait_times)
+
+        if waits:
+            stats["wait_p50"] = round(waits[len(waits) // 2], 3)
+            stats["wait_p99"] = round(waits[min(int(len(waits) * 0.99), len(waits) - 1)], 3)
+        return stats
@@ -0,0 +1,204 @@
+# pubg_api/rate_limiter.py
+import os
+import sqlite3
+import time
+from typing import Optional
+from contextlib import closing
+
+# instance/ приложения (рядом с пакетом pubg_api), а не текущей папки: все процессы должны видеть один файл
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "instance", "pubg_rate_limit.db"
+)
+
+
+class SharedTokenBucket:
+    """
+    Token bucket лимита PUBG API, общий для всех экземпляров клиента и всех процессов
+    (gunicorn-воркеры + планировщик).
+
+    Состояние ведра хранится в отдельном SQLite-файле, атомарность операций
+    обеспечивает блокировка записи BEGIN IMMEDIATE.
+    Емкость и остаток подстраиваются под заголовки X-RateLimit-* ответов API.
+    """
+
+    def __init__(self, name: str = "pubg_api", capacity: int = 10, period: float = 60, db_path: str = None):
+        self.name = name
+        self.capacity = capacity
+        self.period = period  # за сколько секунд ведро наполняется полностью
+        self.db_path = db_path or os.getenv("PUBG_RATE_LIMIT_DB", DEFAULT_DB_PATH)
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._init_db()
+
+    def _connect(self):
+        # isolation_level=None - транзакциями управляем сами
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def _init_db(self):
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS token_bucket (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    capacity REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    blocked_until REAL NOT NULL DEFAULT 0
+                )
+                """
+            )
+            # Файлы, созданные до появления паузы по 429
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(token_bucket)")]
+            if "blocked_until" not in columns:
+                conn.execute("ALTER TABLE token_bucket ADD COLUMN blocked_until REAL NOT NULL DEFAULT 0")
+
+            conn.execute(
+                "INSERT OR IGNORE INTO token_bucket (name, tokens, capacity, updated_at) VALUES (?, ?, ?, ?)",
+                (self.name, self.capacity, self.capacity, time.time())
+            )
+
+    def _load(self, conn) -> dict:
+        tokens, capacity, updated_at, blocked_until = conn.execute(
+            "SELECT tokens, capacity, updated_at, blocked_until FROM token_bucket WHERE name = ?",
+            (self.name,)
+        ).fetchone()
+        return {
+            "tokens": tokens,
+            "capacity": capacity,
+            "updated_at": updated_at,
+            "blocked_until": blocked_until
+        }
+
+    def _refill(self, state: dict, now: float) -> dict:
+        """Досыпаем токены за прошедшее время с учетом паузы после 429"""
+        blocked_until = state["blocked_until"]
+
+        if blocked_until and now < blocked_until:
+            # Пока действует пауза, токены не появляются
+            state["updated_at"] = now
+            return state
+
+        if blocked_until:
+            # Окно API сброшено: ведро снова полное, за вычетом уже выданных резервов
+            state["tokens"] = state["capacity"] + min(state["tokens"], 0)
+            state["updated_at"] = blocked_until
+            state["blocked_until"] = 0
+
+        elapsed = max(now - state["updated_at"], 0)
+        state["tokens"] = min(state["capacity"], state["tokens"] + elapsed * state["capacity"] / self.period)
+        state["updated_at"] = now
+        return state
+
+    def _wait_time(self, state: dict, tokens: int, now: float) -> float:
+        """Сколько секунд ждать, пока в ведре появятся tokens токенов"""
+        rate = state["capacity"] / self.period
+
+        if state["blocked_until"] > now:
+            available_at_reset = state["capacity"] + min(state["tokens"], 0)
+            deficit = max(tokens - available_at_reset, 0)
+            return state["blocked_until"] - now + deficit / rate
+
+        if state["tokens"] >= tokens:
+            return 0.0
+        return (tokens - state["tokens"]) / rate
+
+    def _transaction(self, operation):
+        """
+        Атомарно читает состояние ведра, применяет operation(state, now)
+        и сохраняет измененное состояние. Возвращает результат operation.
+        """
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                state = self._refill(self._load(conn), now)
+
+                result = operation(state, now)
+
+                conn.execute(
+                    "UPDATE token_bucket SET tokens = ?, capacity = ?, updated_at = ?, blocked_until = ? WHERE name = ?",
+                    (state["tokens"], state["capacity"], state["updated_at"], state["blocked_until"], self.name)
+                )
+                conn.execute("COMMIT")
+                return result
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _snapshot(self):
+        """Текущее состояние ведра без изменения"""
+        with closing(self._connect()) as conn:
+            state = self._load(conn)
+        now = time.time()
+        return self._refill(state, now), now
+
+    def try_acquire(self, tokens: int = 1) -> bool:
+        """Забирает токены, если они есть. Не ждет"""
+        return self.reserve(tokens, max_wait=0) is not None
+
+    def remaining(self) -> int:
+        """Сколько запросов можно сделать прямо сейчас"""
+        state, now = self._snapshot()
+        if state["blocked_until"] > now:
+            return 0
+        return max(int(state["tokens"]), 0)
+
+    def time_to_next_token(self) -> float:
+        """Сколько секунд ждать до появления следующего токена (0 - токен уже есть)"""
+        state, now = self._snapshot()
+        return self._wait_time(state, 1, now)
+
+    def reserve(self, tokens: int = 1, max_wait: float = None) -> Optional[float]:
+        """
+        Резервирует токены за O(1) и возвращает, сколько секунд нужно подождать до их появления.
+        Баланс может уйти в минус - так следующие резервы встают в очередь за текущим.
+        Если ждать пришлось бы дольше max_wait, ничего не резервирует и возвращает None.
+        """
+        def operation(state, now):
+            wait = self._wait_time(state, tokens, now)
+            if max_wait is not None and wait > max_wait:
+                return None
+            state["tokens"] -= tokens
+            return wait
+
+        return self._transaction(operation)
+
+    def acquire(self, tokens: int = 1, timeout: float = None) -> bool:
+        """
+        Забирает токены с ожиданием не дольше timeout секунд.
+        timeout=0 - не ждать совсем (для веб-запросов), None - ждать сколько потребуется.
+        Возвращает False, если уложиться в timeout невозможно (сразу, без ожидания).
+        """
+        wait = self.reserve(tokens, max_wait=timeout)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def calibrate(self, limit: Optional[int], remaining: Optional[int], reset_at: Optional[float]):
+        """
+        Подстраивает ведро под заголовки ответа API:
+        limit - емкость ключа, remaining - сколько запросов осталось у API, reset_at - unix-время сброса окна
+        """
+        def operation(state, now):
+            if limit:
+                state["capacity"] = float(limit)
+                state["tokens"] = min(state["tokens"], state["capacity"])
+            if remaining is not None:
+                # Верим API, только если он насчитал меньше нас - наши резервы он еще не видел
+                state["tokens"] = min(state["tokens"], float(remaining))
+                if remaining <= 0 and reset_at and reset_at > now:
+                    state["blocked_until"] = max(state["blocked_until"], reset_at)
+
+        self._transaction(operation)
+
+    def pause_until(self, reset_at: float):
+        """Останавливает выдачу токенов до reset_at (после ответа 429)"""
+        def operation(state, now):
+            state["tokens"] = min(state["tokens"], 0)
+            if reset_at > now:
+                state["blocked_until"] = max(state["blocked_until"], reset_at)
+
+        self._transaction(operation)
@@ -1,23 +1,186 @@
+import atexit
 import importlib
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+import click
+from datetime import timedelta
 from flask_apscheduler import APScheduler
-from models import ScheduledTask
+from flask.cli import AppGroup
+from sqlalchemy import case, or_, update
+from sqlalchemy.exc import IntegrityError
+from models import ScheduledTask, SchedulerLease
 from extensions.db_connection import db
 from pubg_api.tasks import *
 from flask import current_app
+from utils.helpers import moscow_now
 
 scheduler = APScheduler()
 
+# SCHEDULER_ENABLED=0 - процесс не запускает задачи (веб-воркеры при отдельном `flask scheduler run`)
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") != "0"
+LEADER_LEASE_NAME = "scheduler"
+LEADER_LEASE_TTL = 60  # сек. без продления, после которых лидерство переходит другому процессу
+LEADER_HEARTBEAT = 20  # как часто лидер продлевает аренду, сек.
+
+_leader = None
+
 def init_scheduler(app):
     scheduler.init_app(app)
-    
-    # Загружаем активные задачи из БД при старте
+
+    # Задачи загружаются в каждый процесс (для страницы задач), но выполняет их только лидер
     with app.app_context():
-        if not scheduler.running:
-            scheduler.start()
+        if SCHEDULER_ENABLED and not scheduler.running:
+            scheduler.start(paused=True)
         tasks = ScheduledTask.query.filter_by(is_active=True).all()
         for task in tasks:
             add_periodic_task(task,app)
 
+    if SCHEDULER_ENABLED:
+        start_scheduler_leader(app)
+
+def _acquire_lease(holder):
+    """Берет или продлевает аренду лидерства. Возвращает True, если процесс - лидер"""
+    now = moscow_now()
+    expires_at = now + timedelta(seconds=LEADER_LEASE_TTL)
+
+    # Один UPDATE атомарен: аренду получит только один из процессов
+    result = db.session.execute(
+        update(SchedulerLease)
+        .where(
+            SchedulerLease.name == LEADER_LEASE_NAME,
+            or_(SchedulerLease.holder == holder, SchedulerLease.expires_at < now)
+        )
+        .values(
+            holder=holder,
+            expires_at=expires_at,
+            acquired_at=case((SchedulerLease.holder == holder, SchedulerLease.acquired_at), else_=now)
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    if result.rowcount:
+        return True
+
+    if db.session.get(SchedulerLease, LEADER_LEASE_NAME) is not None:
+        return False
+
+    db.session.add(SchedulerLease(name=LEADER_LEASE_NAME, holder=holder, expires_at=expires_at, acquired_at=now))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+def current_scheduler_leader():
+    """Текущая аренда лидерства (или None)"""
+    return db.session.get(SchedulerLease, LEADER_LEASE_NAME)
+
+def is_scheduler_leader():
+    return _leader is not None and _leader.is_leader
+
+def sync_jobs_from_db(app):
+    """Приводит задачи планировщика в соответствие с таблицей ScheduledTask (их меняют и другие процессы)"""
+    active = {str(task.id): task for task in ScheduledTask.query.filter_by(is_active=True).all()}
+
+    for job in scheduler.get_jobs():
+        if job.id not in active:
+            scheduler.remove_job(job.id)
+
+    for job_id, task in active.items():
+        job = scheduler.get_job(job_id)
+        if job is None or getattr(job.trigger, "interval", None) != timedelta(minutes=task.interval_minutes):
+            add_periodic_task(task, app)
+
+class SchedulerLeader(threading.Thread):
+    """
+    Выбор лидера через аренду в БД: планировщик работает во всех процессах на паузе,
+    задачи выполняет только держатель аренды. Если лидер перестал продлевать аренду,
+    ее забирает другой процесс
+    """
+
+    def __init__(self, app):
+        super().__init__(daemon=True, name="scheduler-leader")
+        self.app = app
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.heartbeat()
+            self._stop_event.wait(LEADER_HEARTBEAT)
+
+    def heartbeat(self):
+        try:
+            with self.app.app_context():
+                leader = _acquire_lease(self.holder)
+                if leader:
+                    sync_jobs_from_db(self.app)
+        except Exception as e:
+            # Без связи с БД лидерство не подтвердить - задачи не выполняем
+            logging.getLogger(__name__).error(f"Ошибка продления аренды планировщика: {e}")
+            leader = False
+
+        if leader and not self.is_leader:
+            logging.getLogger(__name__).info(f"Процесс {self.holder} стал лидером планировщика")
+            scheduler.resume()
+        elif not leader and self.is_leader:
+            logging.getLogger(__name__).warning(f"Процесс {self.holder} потерял лидерство планировщика")
+            scheduler.pause()
+        self.is_leader = leader
+
+    def release(self):
+        """Останавливает задачи и отдает аренду, чтобы другой процесс не ждал ее истечения"""
+        self._stop_event.set()
+        if self.is_leader:
+            scheduler.pause()
+            self.is_leader = False
+        try:
+            with self.app.app_context():
+                SchedulerLease.query.filter_by(name=LEADER_LEASE_NAME, holder=self.holder).update({"expires_at": moscow_now()})
+                db.session.commit()
+        except Exception:
+            pass
+
+def start_scheduler_leader(app):
+    """Запускает участие процесса в выборе лидера планировщика"""
+    global _leader
+    if _leader is not None:
+        return _leader
+
+    if not scheduler.running:
+        scheduler.start(paused=True)
+    if not scheduler.running:
+        # Родительский процесс перезагрузчика Flask в debug-режиме: задачи выполняет дочерний
+        return None
+
+    _leader = SchedulerLeader(app)
+    _leader.start()
+    atexit.register(_leader.release)
+    return _leader
+
+scheduler_cli = AppGroup("scheduler", help="Планировщик задач")
+
+@scheduler_cli.command("run")
+def run_scheduler_command():
+    """Отдельный процесс планировщика (веб-воркеры можно запускать с SCHEDULER_ENABLED=0)"""
+    app = current_app._get_current_object()
+    leader = start_scheduler_leader(app)
+    if leader is None:
+        raise click.ClickException("Не удалось запустить планировщик (запуск из перезагрузчика Flask?)")
+
+    click.echo(f"Планировщик запущен, процесс {leader.holder}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        leader.release()
+
 def get_task_function(function_name):
     module = importlib.import_module(f'pubg_api.tasks.{function_name}')
     return getattr(module, function_name)
@@ -55,6 +218,16 @@ def toggle_task(task, activate: bool, app):
         remove_periodic_task(task)
 
 def run_task_now(task,app):
+    """
+    Запускает задачу в отдельном потоке: фоновые задачи ждут квоту API минутами,
+    и HTTP-запрос администратора не должен держать воркер все это время
+    """
     func = get_task_function(task.function_name)
-    with app.app_context():
-        func(app)
\ No newline at end of file
+    thread = threading.Thread(
+        target=func,
+        args=(app,),
+        name=f"task-{task.function_name}",
+        daemon=True
+    )
+    thread.start()
+    return thread
\ No newline at end of file
@@ -0,0 +1,58 @@
+# pubg_api/singleflight.py
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Схлопывание одинаковых одновременных запросов.
+
+    Первый вызов с ключом выполняет функцию, остальные вызовы с тем же ключом,
+    пришедшие пока он выполняется, ждут и получают тот же результат (или ту же ошибку).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}  # key -> Future
+        self._calls = 0
+        self._coalesced = 0
+
+    def do(self, key, func, *args, timeout: float = None, **kwargs):
+        """
+        Выполняет func(*args, **kwargs) один раз на все одновременные вызовы с этим ключом.
+        timeout - сколько ждать чужой результат (None - без ограничения)
+        """
+        with self._lock:
+            self._calls += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._coalesced += 1
+                leader = False
+            else:
+                future = Future()
+                self._in_flight[key] = future
+                leader = True
+
+        if not leader:
+            return future.result(timeout=timeout)
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        """Счетчики: всего вызовов, сколько из них схлопнуто, сколько ключей выполняется сейчас"""
+        with self._lock:
+            return {
+                "calls": self._calls,
+                "coalesced": self._coalesced,
+                "in_flight": len(self._in_flight)
+            }
@@ -1 +1,2 @@
-from .update_all_player_stats import update_all_player_stats
\ No newline at end of file
+from .update_all_player_stats import update_all_player_stats
+from .ingest_clan_matches import ingest_clan_matches
\ No newline at end of file
@@ -0,0 +1,105 @@
+import asyncio
+import os
+from flask import Flask
+
+from models import User, PlayerStats, TaskRunStatusEnum
+from extensions.db_connection import db
+from pubg_api.async_client import AsyncPUBGApiClient
+from services.match_repository import match_repository
+
+# Импорт логирования
+from services.admin_log_service import log_admin_action as log
+from services.task_run_service import start_task_run, checkpoint_task_run, finish_task_run
+from services.negative_cache_service import cached_error_keys, prolong_errors
+
+# Сколько новых матчей загружать за один запуск
+MATCH_INGEST_LIMIT = int(os.getenv("MATCH_INGEST_LIMIT", 200))
+# Одновременных запросов к /matches (эндпоинт не расходует квоту), не больше лимита полосы PUBG_API_MATCH_CONCURRENCY
+MATCH_INGEST_CONCURRENCY = int(os.getenv("MATCH_INGEST_CONCURRENCY", 10))
+# Матчей в одной пачке: загружаются параллельно и сохраняются одной транзакцией
+MATCH_INGEST_CHUNK = 20
+# Сколько помнить, что матча нет в API: матчи старше срока хранения (14 дней) не вернутся
+MATCH_GONE_TTL = 30 * 24 * 3600
+
+def _match_error_key(match_id, shard="steam"):
+    return f"match:{shard}:{match_id}"  # ключ кеша ошибок PUBGApiClient.get_match_by_id
+
+def _drop_gone(match_ids):
+    """Убирает матчи, которых заведомо нет в API (ответ 404 в кеше ошибок), чтобы они не занимали лимит запуска"""
+    gone = cached_error_keys(_match_error_key(match_id) for match_id in match_ids)
+    return [match_id for match_id in match_ids if _match_error_key(match_id) not in gone]
+
+def _clan_match_ids():
+    """Объединение последних матчей участников клана, без дублей"""
+    rows = (
+        db.session.query(PlayerStats.match_ids)
+        .join(User, User.id == PlayerStats.user_id)
+        .filter(User.role.in_(["admin", "moderator", "clan_member"]))
+        .all()
+    )
+    match_ids = []
+    for (ids,) in rows:
+        match_ids.extend(ids or [])
+    return list(dict.fromkeys(match_ids))
+
+def ingest_clan_matches(app: Flask):
+    """
+    Загружает в MatchStats последние матчи участников клана, которых еще нет в БД,
+    чтобы страницы матчей и аналитика читали их локально, а не ждали API
+    """
+    with app.app_context():  # Используем существующий app
+        run, cursor = start_task_run("ingest_clan_matches")
+        if run is None:
+            log("Загрузка матчей клана уже выполняется, запуск пропущен", True)
+            return {"status": "skipped"}
+
+        try:
+            result = asyncio.run(_ingest(run, cursor))
+        except Exception as e:
+            db.session.rollback()
+            finish_task_run(run, TaskRunStatusEnum.FAILED, e)
+            raise
+
+        finish_task_run(run, TaskRunStatusEnum.PARTIAL if result["status"] == "partial" else TaskRunStatusEnum.SUCCESS)
+        return result
+
+async def _ingest(run, cursor):
+    # Сначала матчи, оставшиеся от прерванного запуска
+    remaining = (cursor or {}).get("remaining") or []
+    missing = _drop_gone(match_repository.missing_ids(remaining + _clan_match_ids()))
+    to_fetch = missing[:MATCH_INGEST_LIMIT]
+    checkpoint_task_run(run, {"remaining": missing}, total=len(to_fetch))
+
+    client = AsyncPUBGApiClient(concurrency=MATCH_INGEST_CONCURRENCY)
+    fetched = 0
+    stored = 0
+    gone = 0
+
+    for i in range(0, len(to_fetch), MATCH_INGEST_CHUNK):
+        chunk = to_fetch[i:i + MATCH_INGEST_CHUNK]
+        matches = await client.gather_matches(chunk)
+        fetched += len(matches)
+        stored += match_repository.store_many(matches.values())
+
+        # Ошибку 404 клиент уже запомнил в кеше ошибок; продлеваем ее, чтобы матч не запрашивался снова
+        failed_keys = {_match_error_key(match_id): match_id for match_id in chunk if match_id not in matches}
+        gone_ids = {failed_keys[key] for key in cached_error_keys(failed_keys)}
+        prolong_errors((_match_error_key(match_id) for match_id in gone_ids), MATCH_GONE_TTL)
+        gone += len(gone_ids)
+
+        outcomes = {
+            match_id: "ok" if match_id in matches else "нет в PUBG API" if match_id in gone_ids else "не загружен"
+            for match_id in chunk
+        }
+        checkpoint_task_run(run, {"remaining": missing[i + MATCH_INGEST_CHUNK:]}, outcomes=outcomes, api_calls=len(chunk))
+
+    failed = len(to_fetch) - fetched
+    log(f"Загружено матчей клана: {stored} (ошибок: {failed}, из них нет в API: {gone}, осталось: {len(missing) - len(to_fetch)})", True)
+    return {
+        "status": "partial" if len(missing) > len(to_fetch) else "success",
+        "fetched": fetched,
+        "stored": stored,
+        "failed": failed,
+        "gone": gone,
+        "total": len(missing)
+    }
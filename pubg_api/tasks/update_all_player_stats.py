@@ -1,76 +1,260 @@
+import os
 from zoneinfo import ZoneInfo
 from pubg_api.client import PUBGApiClient
-from models import User, PlayerStats
+from models import User, PlayerStats, TaskRunStatusEnum
 from extensions.db_connection import db
-from datetime import datetime
-import time
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from flask import Flask
 
 # Импорт логирования
 from services.admin_log_service import log_admin_action as log
+from services.task_run_service import start_task_run, checkpoint_task_run, finish_task_run
+from services.negative_cache_service import cached_error_keys
 
-pubg_api = PUBGApiClient()
+pubg_api = PUBGApiClient(blocking=True)  # фоновая задача может ждать квоту
 
-def update_all_player_stats(app: Flask):
+# Статистика свежее этого возраста не обновляется
+SWEEP_MIN_AGE = timedelta(minutes=int(os.getenv("STATS_SWEEP_MIN_AGE", 60)))
+# Сколько запросов к API может сделать один запуск задачи (остальная квота - интерактивным запросам)
+SWEEP_API_BUDGET = int(os.getenv("STATS_SWEEP_API_BUDGET", 15))
+
+UNCHECKED = "не проверен: исчерпан бюджет запросов"
+
+def _stale_users(min_age):
+    """Пользователи клана (id, ник, pubg_id) от самой старой статистики к самой свежей, без свежих"""
+    cutoff = datetime.now(ZoneInfo("Europe/Moscow")) - min_age
+    return (
+        db.session.query(User.id, User.pubg_nickname, PlayerStats.pubg_id)
+        .outerjoin(PlayerStats, PlayerStats.user_id == User.id)
+        .filter(
+            User.role.in_(["admin", "moderator", "clan_member"]),
+            User.username != "admin",
+            or_(PlayerStats.updated_at.is_(None), PlayerStats.updated_at < cutoff)
+        )
+        # Сначала те, у кого статистики еще нет
+        .order_by(PlayerStats.updated_at.isnot(None), PlayerStats.updated_at, User.id)
+        .all()
+    )
+
+def _upsert_identities(identities):
+    """
+    Сохраняет pubg_id и последние матчи игроков.
+    Для новых строк статистика появится позже (updated_at пуст), у существующих обновляются только id и матчи
+    """
+    if not identities:
+        return
+    statement = sqlite_insert(PlayerStats).values([
+        {"user_id": user_id, "pubg_id": pubg_id, "match_ids": match_ids, "stats_json": {}, "updated_at": None}
+        for user_id, (pubg_id, match_ids) in identities.items()
+    ])
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[PlayerStats.user_id],
+        set_={"pubg_id": statement.excluded.pubg_id, "match_ids": statement.excluded.match_ids}
+    ))
+
+def _upsert_stats(stats_rows):
+    """Сохраняет статистику пачки игроков одним запросом"""
+    if not stats_rows:
+        return
+    statement = sqlite_insert(PlayerStats).values(stats_rows)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[PlayerStats.user_id],
+        set_={
+            "pubg_id": statement.excluded.pubg_id,
+            "stats_json": statement.excluded.stats_json,
+            "updated_at": statement.excluded.updated_at
+        }
+    ))
+
+def _without_known_missing(rows):
+    """
+    Убирает игроков без pubg_id, чей ник API недавно не нашел (кеш ошибок): иначе они, не получая статистики,
+    стоят первыми в каждом запуске. Проверяются снова, когда запись кеша истечет
+    """
+    missing = cached_error_keys(f"player:steam:{user.pubg_nickname}" for user in rows if not user.pubg_id)
+    kept = [user for user in rows if user.pubg_id or f"player:steam:{user.pubg_nickname}" not in missing]
+    return kept, len(rows) - len(kept)
+
+def _resume_order(rows, cursor):
+    """Сначала игроки, оставшиеся от прерванного запуска (в прежнем порядке), затем остальные"""
+    remaining = (cursor or {}).get("remaining") or []
+    if not remaining:
+        return rows
+    position = {user_id: index for index, user_id in enumerate(remaining)}
+    return sorted(rows, key=lambda row: position.get(row.id, len(position)))
+
+def update_all_player_stats(app: Flask, min_age: timedelta = None, api_budget: int = None):
+    """
+    Инкрементальное обновление статистики клана.
+    Обрабатывает самых давно обновленных игроков и останавливается, когда исчерпан бюджет запросов,
+    поэтому задачу стоит запускать часто (например, раз в 5 минут).
+    Прогресс сохраняется после каждой пачки, прерванный запуск продолжается со своей контрольной точки
+    """
     with app.app_context():  # Используем существующий app
+        run, cursor = start_task_run("update_all_player_stats")
+        if run is None:
+            log("Обновление статистики клана уже выполняется, запуск пропущен", True)
+            return {"status": "skipped"}
 
-        users = User.query.filter(
-            User.role.in_(["admin", "moderator", "clan_member"])
-        ).all()
-        
-        request_count = 0
-        total_users = len(users)
-        processed_users = 0
+        try:
+            result = _sweep(run, cursor, min_age, api_budget)
+        except Exception as e:
+            db.session.rollback()
+            finish_task_run(run, TaskRunStatusEnum.FAILED, e)
+            raise
 
-        for user in users:
+        if result["status"] == "failed":
+            finish_task_run(run, TaskRunStatusEnum.FAILED, "Не удалось обновить статистику ни одного игрока")
+        else:
+            finish_task_run(run, TaskRunStatusEnum.PARTIAL if result["status"] == "partial" else TaskRunStatusEnum.SUCCESS)
+        return result
+
+def _sweep(run, cursor, min_age, api_budget):
+    min_age = min_age if min_age is not None else SWEEP_MIN_AGE
+    budget = api_budget if api_budget is not None else SWEEP_API_BUDGET
+    stats_cost = len(pubg_api.FPP_GAME_MODES)  # запросов статистики на пачку игроков
+
+    rows, not_found_users = _without_known_missing(_stale_users(min_age))
+    rows = _resume_order(rows, cursor)
+    total_users = len(rows)
+    processed_users = 0
+    api_calls = 0
+    budget_exhausted = False
+    checkpoint_task_run(run, {"remaining": [user.id for user in rows]}, total=total_users)
+
+    # Пачки по 10: на пачку поиск ников (если нужен), запрос игроков по id (последние матчи) и по запросу на режим игры
+    for i in range(0, total_users, pubg_api.PLAYER_IDS_BATCH):
+        batch = rows[i:i + pubg_api.PLAYER_IDS_BATCH]
+        missing_ids = [user for user in batch if not user.pubg_id]
+        known_ids = [user for user in batch if user.pubg_id]
+        lookup_cost = (1 if missing_ids else 0) + (1 if known_ids else 0)
+
+        # Бюджет считается по реально отправленным запросам (поиск ников может делить пачку и стоить больше одного)
+        if api_calls + lookup_cost + stats_cost > budget:
+            budget_exhausted = True
+            break
+        calls_before = pubg_api.metered_calls
+
+        pubg_ids = {user.id: user.pubg_id for user in known_ids}
+        identities = {}  # user_id -> (pubg_id, match_ids): найденные по нику и обновленные списки матчей
+        outcomes = {}
+        problems = []
+
+        # Последние матчи игроков с известным pubg_id (по ним задача ingest_clan_matches загружает матчи)
+        if known_ids:
             try:
-                if user.username == "admin":
-                    continue
+                players_by_id = pubg_api.get_players_by_ids([user.pubg_id for user in known_ids])
+            except Exception as e:
+                problems.append(f"ошибка обновления списков матчей: {str(e)}")
+                players_by_id = {}
+            for user in known_ids:
+                player = players_by_id.get(user.pubg_id)
+                if player:
+                    identities[user.id] = (player.id, player.match_ids)
 
-                cached = PlayerStats.query.filter_by(user_id=user.id).first()
-
-                # Получение pubg_id
-                if not cached or not cached.pubg_id:
-                    if request_count >= 10:
-                        time.sleep(60)
-                        request_count = 0
-                    
-                    player = pubg_api.get_player_by_name(user.pubg_nickname)
-                    pubg_id = player.id
-                    request_count += 1
-
-                    if not cached:
-                        cached = PlayerStats(user_id=user.id, pubg_id=pubg_id)
-                        db.session.add(cached)
-                    else:
-                        cached.pubg_id = pubg_id
-
-                    db.session.commit()
-
-                # Получение статистики
-                if request_count >= 10:
-                    time.sleep(60)
-                    request_count = 0
-                
-                stats = pubg_api.get_player_lifetime_stats_by_id(cached.pubg_id)
-                cached.stats_json = stats.to_dict()
-                cached.updated_at = datetime.now(ZoneInfo("Europe/Moscow"))
-                db.session.commit()
-                request_count += 1
-
-                processed_users += 1 
-
-                time.sleep(1)
+        # Получение pubg_id пачкой вместо запроса на каждого игрока; на статистику пачки остается stats_cost запросов
+        if missing_ids:
+            try:
+                players, not_found = pubg_api.get_players_by_names(
+                    [user.pubg_nickname for user in missing_ids],
+                    max_calls=budget - (pubg_api.metered_calls - calls_before) - api_calls - stats_cost
+                )
+            except Exception as e:
+                problems.append(f"ошибка пакетного поиска игроков: {str(e)}")
+                players, not_found = {}, None
+
+            for user in missing_ids:
+                player = players.get(user.pubg_nickname)
+                if not player:
+                    # Ник не в списке ненайденных - до него не дошла очередь (кончился бюджет)
+                    unchecked = not_found is not None and user.pubg_nickname not in not_found
+                    outcomes[user.id] = UNCHECKED if unchecked else "не найден в PUBG API"
+                    budget_exhausted = budget_exhausted or unchecked
+                    continue
+                identities[user.id] = (player.id, player.match_ids)
+                pubg_ids[user.id] = player.id
 
+        # Получение статистики: по одному запросу на 10 игроков и режим игры
+        stats_rows = []
+        with_ids = [user for user in batch if user.id in pubg_ids]
+        if with_ids:
+            try:
+                stats_by_id = pubg_api.get_players_lifetime_stats_by_ids([pubg_ids[user.id] for user in with_ids])
             except Exception as e:
-                log(f"Ошибка обновления статистики для {user.pubg_nickname}: {str(e)}", True)
-                db.session.rollback()
-                continue
-
-        log("Обновление статистики по участникам клана прошло успешно", True)
-        return {
-            "status": "success",
-            "processed": processed_users,
-            "total": total_users
-        }
+                problems.append(f"ошибка получения статистики: {str(e)}")
+                stats_by_id = {}
+                outcomes.update({user.id: str(e) for user in with_ids})
+
+            now = datetime.now(ZoneInfo("Europe/Moscow"))
+            for user in with_ids:
+                if user.id in outcomes:
+                    continue
+                stats = stats_by_id.get(pubg_ids[user.id])
+                if not stats:
+                    outcomes[user.id] = "нет статистики"
+                    continue
+                try:
+                    stats_rows.append({
+                        "user_id": user.id,
+                        "pubg_id": pubg_ids[user.id],
+                        "stats_json": stats.to_dict(),
+                        "updated_at": now
+                    })
+                except Exception as e:
+                    # Ошибка одного игрока не мешает сохранить остальных
+                    outcomes[user.id] = str(e)
+                    continue
+                outcomes[user.id] = "ok"
+
+        # Запись пачки одной транзакцией вместе с контрольной точкой
+        batch_calls = pubg_api.metered_calls - calls_before
+        api_calls += batch_calls
+        processed_users += len(stats_rows)
+        try:
+            _upsert_identities(identities)
+            _upsert_stats(stats_rows)
+        except Exception as e:
+            db.session.rollback()
+            problems.append(f"ошибка сохранения: {str(e)}")
+            outcomes.update({row["user_id"]: str(e) for row in stats_rows})
+            processed_users -= len(stats_rows)
+
+        # Непроверенные игроки пачки - первыми в следующем запуске
+        remaining = [user.id for user in batch if outcomes.get(user.id) == UNCHECKED]
+        remaining += [user.id for user in rows[i + pubg_api.PLAYER_IDS_BATCH:]]
+        checkpoint_task_run(run, {"remaining": remaining}, outcomes=outcomes, api_calls=batch_calls)
+
+        failed = {user.pubg_nickname: outcomes[user.id] for user in batch if outcomes.get(user.id, "ok") != "ok"}
+        if problems or failed:
+            details = "; ".join(problems + [f"{nickname}: {error}" for nickname, error in failed.items()])
+            log(f"Ошибки обновления статистики: {details}", True)
+
+        if budget_exhausted:
+            break
+
+    skipped = f"; пропущено с ненайденным ником: {not_found_users}" if not_found_users else ""
+    if budget_exhausted:
+        status = "partial"
+        log(f"Обновлена статистика {processed_users} из {total_users} устаревших игроков, остальные - в следующий запуск{skipped}", True)
+    elif total_users and not processed_users:
+        status = "failed"
+        log(f"Не удалось обновить статистику ни одного из {total_users} устаревших игроков{skipped}", True)
+    elif processed_users < total_users:
+        status = "success"
+        log(f"Обновлена статистика {processed_users} из {total_users} устаревших игроков, остальные - с ошибками{skipped}", True)
+    elif total_users:
+        status = "success"
+        log(f"Обновление статистики по участникам клана прошло успешно{skipped}", True)
+    else:
+        status = "success"
+        log(f"Устаревшей статистики нет, обновление не требуется{skipped}", True)
+    return {
+        "status": status,
+        "processed": processed_users,
+        "total": total_users,
+        "not_found": not_found_users,
+        "api_calls": api_calls
+    }
@@ -30,6 +30,12 @@ from pubg_api.scheduler import *
 # Импорт PUBG API
 from pubg_api.client import PUBGApiClient
 from utils.helpers import export_tournament_stats
+from services.match_repository import match_repository
+from services.negative_cache_service import clear_negative_cache, negative_cache_size
+from services.player_stats_service import is_stale, queue_refresh, get_refresh_status
+from services.job_queue import job_queue_stats, requeue_dead_jobs
+from services.task_run_service import task_run_history
+from pubg_api.queue_worker import Priority
 client = PUBGApiClient()
 
 
@@ -707,50 +713,22 @@ def user_profile(user_id):
     player_stats = None
     updated_at = None
     match_ids = []
+    refresh_pending = False
 
-    # Получаем или создаем запись в PlayerStats
     cached_stats = PlayerStats.query.filter_by(user_id=user.id).first()
     
-    # Обработка POST запроса (обновление статистики)
+    # Обработка POST запроса (обновление статистики в фоне)
     if request.method == 'POST':
-        try:
-            if not cached_stats:
-                cached_stats = PlayerStats(user_id=user.id)
-                db.session.add(cached_stats)
-            
-            # Получаем свежие данные из API
-            player = client.get_player_by_name(user.pubg_nickname)
-            if not player:
-                return jsonify({"success": False, "error": "Игрок не найден"}), 404
-            
-            stats = client.get_player_lifetime_stats_by_id(player.id)
-            
-            # Обновляем данные
-            cached_stats.pubg_id = player.id
-            cached_stats.stats_json = stats.to_dict() if stats else {}
-            cached_stats.match_ids = getattr(player, 'match_ids', [])
-            cached_stats.updated_at = datetime.now(ZoneInfo("Europe/Moscow"))
-            
-            db.session.commit()
-            
-            # Обновляем переменные для отображения
-            player_stats = ParsedPlayerStats.from_json(cached_stats.stats_json) if cached_stats.stats_json else None
-            match_ids = cached_stats.match_ids or []
-            updated_at = cached_stats.updated_at
-            
-            return jsonify({
-                "success": True,
-                "updated_at": updated_at.isoformat(),
-                "stats": player_stats.to_dict() if player_stats else {},
-                "match_ids": match_ids
-            })
-            
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f"Error updating stats: {str(e)}", exc_info=True)
-            return jsonify({"success": False, "error": str(e)}), 500
+        if not queue_refresh(user.id, priority=Priority.INTERACTIVE, force=True):
+            return jsonify({"success": False, "error": "Не удалось поставить обновление в очередь"}), 500
+
+        return jsonify({
+            "success": True,
+            "queued": True,
+            "updated_at": cached_stats.updated_at.isoformat() if cached_stats and cached_stats.updated_at else None
+        })
     
-    # Обработка GET запроса
+    # Обработка GET запроса: показываем данные из БД, устаревшие обновляем в фоне
     if cached_stats:
         try:
             player_stats = ParsedPlayerStats.from_json(cached_stats.stats_json) if cached_stats.stats_json else None
@@ -759,35 +737,22 @@ def user_profile(user_id):
         except Exception as e:
             current_app.logger.error(f"Error loading stats: {str(e)}", exc_info=True)
             flash("Ошибка при загрузке статистики", "error")
-    else:
-        # Первоначальная загрузка данных, если их нет в БД
-        try:
-            player = client.get_player_by_name(user.pubg_nickname)
-            if player:
-                stats = client.get_player_lifetime_stats_by_id(player.id)
-                
-                cached_stats = PlayerStats(
-                    user_id=user.id,
-                    pubg_id=player.id,
-                    stats_json=stats.to_dict() if stats else {},
-                    match_ids=getattr(player, 'match_ids', [])
-                )
-                db.session.add(cached_stats)
-                db.session.commit()
-                
-                player_stats = ParsedPlayerStats.from_json(cached_stats.stats_json) if cached_stats.stats_json else None
-                updated_at = cached_stats.updated_at
-                match_ids = cached_stats.match_ids or []
-                
-        except Exception as e:
-            current_app.logger.error(f"Error fetching initial stats: {str(e)}", exc_info=True)
-            flash(f"Ошибка при получении данных: {str(e)}", "error")
+
+    if user.username != "admin" and is_stale(cached_stats):
+        refresh_pending = queue_refresh(user.id, priority=Priority.INTERACTIVE)
 
     return render_template('admin/users/user_profile.html', 
                          user=user, 
                          stats=player_stats, 
                          updated_at=updated_at,
-                         match_ids=match_ids)
+                         match_ids=match_ids,
+                         refresh_pending=refresh_pending)
+
+# Состояние фонового обновления статистики пользователя
+@admin_bp.route('/profile/<int:user_id>/stats_status', methods=['GET'])
+@role_required([RoleEnum.ADMIN, RoleEnum.MODERATOR])
+def user_profile_stats_status(user_id):
+    return jsonify(get_refresh_status(user_id))
 
 # Страница со списком задач
 @admin_bp.route('/tasks')
@@ -827,7 +792,16 @@ def tasks():
         )
 
     tasks = ScheduledTask.query.all()
-    return render_template('admin/superadmin_menu/tasks.html', tasks=tasks, funcs = task_functions, jobs = job_list)
+    return render_template('admin/superadmin_menu/tasks.html',
+                           tasks=tasks,
+                           funcs = task_functions,
+                           jobs = job_list,
+                           match_cache = match_repository.stats(),
+                           negative_cache_size = negative_cache_size(),
+                           api_jobs = job_queue_stats(),
+                           task_runs = task_run_history(),
+                           scheduler_leader = current_scheduler_leader(),
+                           is_leader = is_scheduler_leader())
 
 # Добавление новой задачи
 @admin_bp.route('/add_task', methods=['POST'])
@@ -883,7 +857,26 @@ def toggle_task_route(task_id):
 @role_required(RoleEnum.ADMIN)
 def run_task(task_id):
     task = ScheduledTask.query.get_or_404(task_id)
-    run_task_now(task, current_app)
+    run_task_now(task, current_app._get_current_object())
+    flash(f"Задача {task.name} запущена в фоне", "success")
+    return redirect('/admin/tasks')
+
+# Очистка кеша ошибок PUBG API (ненайденные ники и т.п.)
+@admin_bp.route('/clear_negative_cache', methods=['POST'])
+@role_required(RoleEnum.ADMIN)
+def clear_negative_cache_route():
+    deleted = clear_negative_cache()
+    log(f"Очищен кеш ошибок PUBG API: {deleted} записей")
+    flash(f"Кеш ошибок PUBG API очищен ({deleted} записей)", "success")
+    return redirect('/admin/tasks')
+
+# Повторный запуск задач из dead letter очереди запросов к API
+@admin_bp.route('/requeue_dead_jobs', methods=['POST'])
+@role_required(RoleEnum.ADMIN)
+def requeue_dead_jobs_route():
+    count = requeue_dead_jobs()
+    log(f"Возвращены в очередь задачи PUBG API: {count}")
+    flash(f"Задач возвращено в очередь: {count}", "success")
     return redirect('/admin/tasks')
 
 # Просмотр деталей матча
@@ -891,37 +884,17 @@ def run_task(task_id):
 @role_required([RoleEnum.ADMIN, RoleEnum.MODERATOR])
 def match_details(match_id):
     try:
-        # Проверяем кеш в БД
-        db_match = MatchStats.query.filter_by(match_id=match_id).first()
-        
-        if db_match:
-            # Используем данные из БД
-            match_data = MatchData(db_match.data_json)
-        else:
-            # Загружаем из API если нет в кеше
-            try:
-                match_data = client.get_match_by_id(match_id)
-                if not match_data.raw_data or 'data' not in match_data.raw_data:
-                    flash("Матч не найден", "danger")
-                    return redirect(url_for('admin.admin'))
-            except Exception as e:
-                flash("Ошибка загрузки матча", "danger")
-                current_app.logger.error(str(e))
-                return redirect(url_for('admin.admin'))
-            
-            try:
-                # Сохраняем в БД
-                new_match = MatchStats(
-                    match_id=match_id,
-                    data_json=match_data.raw_data,
-                    processed_at=datetime.now(ZoneInfo("Europe/Moscow"))
-                )
-                db.session.add(new_match)
-                db.session.commit()
-            except Exception as e:
-                db.session.rollback()
-                current_app.logger.error(f"Ошибка сохранения матча: {str(e)}")
-                flash("Данные матча не сохранены в БД", "warning")
+        # Память процесса -> БД -> API
+        try:
+            match_data = match_repository.get(match_id)
+        except Exception as e:
+            flash("Ошибка загрузки матча", "danger")
+            current_app.logger.error(str(e))
+            return redirect(url_for('admin.admin'))
+
+        if not match_data:
+            flash("Матч не найден", "danger")
+            return redirect(url_for('admin.admin'))
         
         # Получаем статистику игрока если указан
         player_name = request.args.get('player')
@@ -955,26 +928,24 @@ def load_api_stats():
         current_match = Match.query.get_or_404(current_match_id)
         tournament = current_match.tournament
         
-        # Получаем данные матча из API
-        match_data = client.get_match_by_id(match_id)
-        if not match_data.raw_data or 'data' not in match_data.raw_data:
+        # Получаем данные матча (из кеша или API)
+        match_data = match_repository.get(match_id)
+        if not match_data:
             return jsonify({'error': 'Матч не найден'}), 404
         
         # Собираем статистику для игроков турнира
         players_stats = []
         tournament_player_names = {p.nickname.lower(): p for p in tournament.players}
         
-        for participant in match_data.participants:
-            player_name = participant.get("name", "").lower()
-            if player_name in tournament_player_names:
-                stats = participant.get("stats", {})
-                player = tournament_player_names[player_name]
-                
+        # Поиск по индексу ников матча вместо перебора всех участников
+        for player_name, player in tournament_player_names.items():
+            participant = match_data.get_participant(player_name)
+            if participant:
                 players_stats.append({
                     'player_id': player.id,
-                    'kills': stats.get('kills', 0),
-                    'damage': stats.get('damage_dealt', 0),
-                    'placement': stats.get('win_place', 0)
+                    'kills': participant.stats.kills,
+                    'damage': participant.stats.damage_dealt,
+                    'placement': participant.stats.win_place
                 })
         
         return jsonify({
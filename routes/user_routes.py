@@ -7,11 +7,13 @@ from sqlalchemy import and_, func
 from pubg_api.models.player import ParsedPlayerStats
 from services.verification_service import generate_verification_code, send_email, send_verification_email
 from utils.helpers import mask_email
+from services.player_stats_service import is_stale, queue_refresh, get_refresh_status
+from pubg_api.queue_worker import Priority
 from models import RoleEnum, User, Tournament, Player, PlayerGroup, AdminActionLog, PlayerStats, JoinRequests, RqStatusEnum, IPStatusEnum
 from extensions.db_connection import db
 
 # Импорт PUBG API
-from pubg_api.client import PUBGApiClient
+from pubg_api.client import PUBGApiClient, PUBGRateLimitException
 client = PUBGApiClient()
 
 
@@ -31,36 +33,21 @@ def profile():
     user = User.query.get_or_404(session['user_logged'])
     player_stats = None
     updated_at = None
+    refresh_pending = False
 
     if user.username != "admin":
+        # Всегда показываем то, что есть в БД, а свежие данные догружаем в фоне
         cached_stats = PlayerStats.query.filter_by(user_id=user.id).first()
         
-        if cached_stats:
+        if cached_stats and cached_stats.stats_json:
             try:
                 player_stats = ParsedPlayerStats.from_json(cached_stats.stats_json)
                 updated_at = cached_stats.updated_at            
             except Exception as e:
                 flash(f"Возникли ошибки при загрузке статистики. Попробуйте позже.", 'warning')
-        else:
-            try:
-                player = client.get_player_by_name(user.pubg_nickname)
-                if player:
-                    try:
-                        player_stats = client.get_player_lifetime_stats_by_id(player.id)
-                        cached_stats = PlayerStats(
-                            user_id=user.id,
-                            pubg_id=player.id,
-                            stats_json=player_stats.to_dict(),
-                            match_ids=player.match_ids
-                        )
-                        db.session.add(cached_stats)
-                        db.session.commit()
-                        updated_at = cached_stats.updated_at
-                    except Exception as e:
-                        db.session.rollback()
-                        flash(f"Статистика временно недоступна.", 'error')
-            except Exception as e:
-                flash(f"Игрока с таким ником не найдено. Проверьте ник. Для изменения обратитесь к администратору", 'error')
+
+        if request.method == 'GET' and is_stale(cached_stats):
+            refresh_pending = queue_refresh(user.id, priority=Priority.INTERACTIVE)
 
     # Обработка POST-запроса (изменение профиля)
     if request.method == 'POST':
@@ -156,8 +143,15 @@ def profile():
                          stats=player_stats, 
                          updated_at=updated_at,
                          masked_email=masked_email,
+                         refresh_pending=refresh_pending,
                          password_change_requested='password_change_data' in session)
 
+# Состояние фонового обновления статистики (опрашивается со страницы профиля)
+@user_bp.route('/profile/stats_status', methods=['GET'])
+@login_required
+def profile_stats_status():
+    return jsonify(get_refresh_status(session['user_logged']))
+
 # Авторизация
 @user_bp.route('/login', methods=['POST'])
 def login():
@@ -335,6 +329,12 @@ def verify_email_ajax():
                             new_user.role = RoleEnum.CLAN_MEMBER
                     except Exception as e:
                         print("Ошибка автоматической установки роли пользователя")
+            except PUBGRateLimitException:
+                # Ник не проверен из-за квоты API: код и данные регистрации остаются в сессии для повтора
+                return jsonify({
+                    'success': False,
+                    'message': 'Сервис PUBG временно перегружен. Повторите подтверждение через минуту.'
+                }), 503
             except Exception as e:
                 return jsonify({
                     'success': False,
@@ -0,0 +1,407 @@
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import timedelta
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import ApiJob, JobStatusEnum
+from extensions.db_connection import db
+from pubg_api.client import PUBGApiClient, PUBGApiException
+from pubg_api.queue_worker import APIQueueWorker, Priority
+from utils.helpers import moscow_now
+
+logger = logging.getLogger(__name__)
+
+# JOB_RUNNER_ENABLED=0 - процесс не берет задачи из очереди (только ставит их)
+JOB_RUNNER_ENABLED = os.getenv("JOB_RUNNER_ENABLED", "1") != "0"
+# Потоков фонового воркера на процесс
+API_WORKERS = int(os.getenv("PUBG_API_WORKERS", 4))
+# На сколько секунд воркер арендует задачу; по истечении аренды задачу заберет другой процесс
+JOB_LEASE_SECONDS = int(os.getenv("PUBG_JOB_LEASE", 300))
+# Как часто процесс продлевает аренду своих задач (ожидающих в локальной очереди и выполняющихся)
+LEASE_RENEW_INTERVAL = JOB_LEASE_SECONDS / 3
+# Сколько обработчик ждет квоту на один запрос: до двух лимитируемых запросов,
+# каждый - до MAX_RETRIES + 1 ожиданий квоты, вместе меньше аренды
+JOB_QUOTA_WAIT = JOB_LEASE_SECONDS / (2 * (PUBGApiClient.MAX_RETRIES + 1))
+# Базовая задержка повтора упавшей задачи (удваивается с каждой попыткой), сек.
+RETRY_BASE_DELAY = 30
+# Как часто обработчик проверяет очередь, сек.
+POLL_INTERVAL = 2
+# Сколько дней хранить выполненные и мертвые задачи
+DONE_RETENTION_DAYS = 7
+DEAD_RETENTION_DAYS = 30
+
+# Обработчики задач: kind -> функция(**payload)
+JOB_HANDLERS = {}
+
+_worker = None
+_runner = None
+_lock = threading.Lock()
+
+
+def job_handler(kind):
+    """Регистрирует функцию как обработчик задач типа kind"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def get_api_worker():
+    """Пул потоков для запросов к API в текущем процессе (запускается при первом обращении)"""
+    global _worker
+    with _lock:
+        if _worker is None:
+            _worker = APIQueueWorker(PUBGApiClient(blocking=True, max_wait=JOB_QUOTA_WAIT), workers=API_WORKERS)
+            _worker.start()
+        return _worker
+
+
+def enqueue_job(kind, payload=None, priority=Priority.BACKGROUND, idempotency_key=None, dedup_key=None,
+                max_attempts=5, delay=0):
+    """
+    Ставит задачу в персистентную очередь.
+
+    - повторная постановка с тем же idempotency_key возвращает уже существующую задачу (в любом статусе);
+    - если задача с тем же dedup_key ждет или выполняется, возвращается она,
+      а более приоритетный дубль повышает приоритет ожидающей задачи
+    """
+    if idempotency_key:
+        existing = ApiJob.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing:
+            return existing
+
+    if dedup_key:
+        existing = _active_duplicate(dedup_key, priority)
+        if existing:
+            return existing
+
+    job = ApiJob(
+        kind=kind,
+        payload=payload or {},
+        priority=priority,
+        idempotency_key=idempotency_key,
+        dedup_key=dedup_key,
+        max_attempts=max_attempts,
+        run_after=moscow_now() + timedelta(seconds=delay)
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Задачу с тем же ключом только что поставил другой процесс
+        db.session.rollback()
+        existing = ApiJob.query.filter_by(idempotency_key=idempotency_key).first() if idempotency_key else None
+        if existing is None and dedup_key:
+            existing = _active_duplicate(dedup_key, priority)
+        if existing is None:
+            raise
+        return existing
+
+    _wake_runner()
+    return job
+
+
+def _active_duplicate(dedup_key, priority):
+    """Ожидающая или выполняющаяся задача с этим dedup_key; более высокий приоритет переносится на нее"""
+    existing = ApiJob.query.filter(
+        ApiJob.dedup_key == dedup_key,
+        ApiJob.status.in_((JobStatusEnum.PENDING, JobStatusEnum.RUNNING))
+    ).first()
+    if existing and existing.status == JobStatusEnum.PENDING and priority < existing.priority:
+        existing.priority = priority
+        db.session.commit()
+        _wake_runner()
+    return existing
+
+
+def claim_job(max_priority=None):
+    """
+    Атомарно забирает самую приоритетную готовую задачу под аренду.
+    Задачи с истекшей арендой (упавший процесс) забираются повторно.
+    max_priority - брать только задачи не ниже этого приоритета
+    """
+    now = moscow_now()
+    token = uuid.uuid4().hex
+    claimable = or_(
+        and_(ApiJob.status == JobStatusEnum.PENDING, ApiJob.run_after <= now),
+        and_(ApiJob.status == JobStatusEnum.RUNNING, ApiJob.lease_until < now)
+    )
+    if max_priority is not None:
+        claimable = and_(claimable, ApiJob.priority <= max_priority)
+    next_id = (
+        select(ApiJob.id)
+        .where(claimable)
+        .order_by(ApiJob.priority, ApiJob.run_after, ApiJob.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+    # Один UPDATE атомарен: SQLite держит блокировку записи, двух владельцев у задачи не будет
+    result = db.session.execute(
+        update(ApiJob)
+        .where(ApiJob.id == next_id, claimable)
+        .values(
+            status=JobStatusEnum.RUNNING,
+            claim_token=token,
+            lease_until=now + timedelta(seconds=JOB_LEASE_SECONDS),
+            attempts=ApiJob.attempts + 1
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    if not result.rowcount:
+        return None
+
+    job = ApiJob.query.filter_by(claim_token=token).first()
+    if job and job.attempts > job.max_attempts:
+        # Задача раз за разом роняла воркер и теряла аренду
+        _finish(job, JobStatusEnum.DEAD, "Превышено число попыток (аренда истекла)")
+        return claim_job(max_priority)
+    return job
+
+
+def renew_leases(leases):
+    """
+    Продлевает аренду задач {job_id: claim_token}, которые процесс еще держит.
+    Возвращает id задач, аренду которых продлить не удалось (задачу забрал другой процесс)
+    """
+    if not leases:
+        return []
+    lease_until = moscow_now() + timedelta(seconds=JOB_LEASE_SECONDS)
+    lost = []
+    for job_id, token in leases.items():
+        result = db.session.execute(
+            update(ApiJob)
+            .where(ApiJob.id == job_id, ApiJob.claim_token == token, ApiJob.status == JobStatusEnum.RUNNING)
+            .values(lease_until=lease_until)
+            .execution_options(synchronize_session=False)
+        )
+        if not result.rowcount:
+            lost.append(job_id)
+    db.session.commit()
+    return lost
+
+
+def _finish(job, status, error=None):
+    job.status = status
+    job.last_error = str(error)[:1024] if error else job.last_error
+    job.finished_at = moscow_now()
+    job.lease_until = None
+    db.session.commit()
+
+
+def _owned_job(job_id, token):
+    """Задача, если аренда все еще наша"""
+    return ApiJob.query.filter_by(id=job_id, claim_token=token, status=JobStatusEnum.RUNNING).first()
+
+
+def complete_job(job_id, token):
+    job = _owned_job(job_id, token)
+    if not job:
+        logger.warning(f"Задача #{job_id} выполнена, но аренда уже потеряна: результат не записан")
+        return
+    _finish(job, JobStatusEnum.DONE)
+
+
+def fail_job(job_id, token, error):
+    """Повтор с экспоненциальной задержкой или перенос в dead letter"""
+    job = _owned_job(job_id, token)
+    if not job:
+        logger.warning(f"Задача #{job_id} упала, но аренда уже потеряна: {error}")
+        return
+
+    permanent = (
+        isinstance(error, PUBGApiException)
+        and error.status_code in PUBGApiClient.PERMANENT_ERROR_STATUSES
+    )
+    if permanent or job.attempts >= job.max_attempts:
+        _finish(job, JobStatusEnum.DEAD, error)
+        logger.error(f"Задача {job.kind} #{job.id} перенесена в dead letter: {error}")
+        return
+
+    delay = RETRY_BASE_DELAY * 2 ** (job.attempts - 1) + random.uniform(0, RETRY_BASE_DELAY)
+    job.status = JobStatusEnum.PENDING
+    job.last_error = str(error)[:1024]
+    job.run_after = moscow_now() + timedelta(seconds=delay)
+    job.lease_until = None
+    db.session.commit()
+
+
+def _execute_job(job_id, token, kind, payload):
+    """Выполняется в потоке APIQueueWorker в контексте приложения"""
+    try:
+        handler = JOB_HANDLERS.get(kind)
+        if handler is None:
+            raise LookupError(f"Нет обработчика для задач типа {kind}")
+        result = handler(**payload)
+    except Exception as e:
+        db.session.rollback()
+        fail_job(job_id, token, e)
+        raise
+
+    complete_job(job_id, token)
+    return result
+
+
+def requeue_dead_jobs():
+    """
+    Возвращает задачи из dead letter в очередь. Возвращает их количество.
+    Из задач с одним dedup_key возвращается только последняя и только если такая задача не ждет уже в очереди
+    """
+    active_keys = {
+        key for (key,) in db.session.query(ApiJob.dedup_key).filter(
+            ApiJob.dedup_key.isnot(None),
+            ApiJob.status.in_((JobStatusEnum.PENDING, JobStatusEnum.RUNNING))
+        )
+    }
+    count = 0
+    now = moscow_now()
+    for job in ApiJob.query.filter_by(status=JobStatusEnum.DEAD).order_by(ApiJob.id.desc()):
+        if job.dedup_key:
+            if job.dedup_key in active_keys:
+                continue
+            active_keys.add(job.dedup_key)
+        job.status = JobStatusEnum.PENDING
+        job.attempts = 0
+        job.run_after = now
+        job.finished_at = None
+        count += 1
+    db.session.commit()
+    _wake_runner()
+    return count
+
+
+def purge_finished_jobs():
+    """Удаляет старые выполненные и мертвые задачи"""
+    now = moscow_now()
+    ApiJob.query.filter(
+        ApiJob.status == JobStatusEnum.DONE,
+        ApiJob.finished_at < now - timedelta(days=DONE_RETENTION_DAYS)
+    ).delete()
+    ApiJob.query.filter(
+        ApiJob.status == JobStatusEnum.DEAD,
+        ApiJob.finished_at < now - timedelta(days=DEAD_RETENTION_DAYS)
+    ).delete()
+    db.session.commit()
+
+
+def job_queue_stats():
+    """Количество задач по статусам"""
+    counts = dict(
+        db.session.query(ApiJob.status, func.count(ApiJob.id)).group_by(ApiJob.status).all()
+    )
+    return {
+        "pending": counts.get(JobStatusEnum.PENDING, 0),
+        "running": counts.get(JobStatusEnum.RUNNING, 0),
+        "done": counts.get(JobStatusEnum.DONE, 0),
+        "dead": counts.get(JobStatusEnum.DEAD, 0)
+    }
+
+
+class JobRunner(threading.Thread):
+    """
+    Переносит задачи из персистентной очереди в локальный пул APIQueueWorker.
+
+    - забирает задачи, только пока у пула есть свободный поток, который может их выполнить
+      (поток 0 пула берет только интерактивные задачи);
+    - продлевает аренду задач, которые ждут в локальной очереди или выполняются,
+      чтобы их не забрал другой процесс
+    """
+
+    PURGE_INTERVAL = 3600
+
+    def __init__(self, app, worker):
+        super().__init__(daemon=True, name="api-job-runner")
+        self.app = app
+        self.worker = worker
+        self.wake = threading.Event()
+        self._last_purge = 0
+        self._last_renew = time.monotonic()
+        self._leases_lock = threading.Lock()
+        self._leases = {}  # job_id -> (claim_token, priority) задач, переданных в пул и еще не завершенных
+
+    def run(self):
+        while True:
+            self.wake.wait(POLL_INTERVAL)
+            self.wake.clear()
+            try:
+                with self.app.app_context():
+                    if time.monotonic() - self._last_renew > LEASE_RENEW_INTERVAL:
+                        self._renew()
+                    self._dispatch()
+                    if time.monotonic() - self._last_purge > self.PURGE_INTERVAL:
+                        purge_finished_jobs()
+                        self._last_purge = time.monotonic()
+            except Exception as e:
+                logger.error(f"Ошибка обработчика очереди задач: {e}")
+
+    def _renew(self):
+        with self._leases_lock:
+            leases = {job_id: token for job_id, (token, _) in self._leases.items()}
+        lost = renew_leases(leases)
+        if lost:
+            logger.warning(f"Аренда задач {lost} потеряна до продления")
+        self._last_renew = time.monotonic()
+
+    def _free_slot(self):
+        """
+        Есть ли свободный поток для новой задачи.
+        Returns:
+            (есть ли поток, ограничение приоритета для claim_job: None - любая задача)
+        """
+        with self._leases_lock:
+            in_flight = len(self._leases)
+            background = sum(1 for _, priority in self._leases.values() if priority > Priority.INTERACTIVE)
+        if in_flight >= self.worker.workers:
+            return False, None
+        # Фоновым задачам доступны все потоки, кроме интерактивного
+        if background >= self.worker.workers - 1:
+            return True, Priority.INTERACTIVE
+        return True, None
+
+    def _release(self, job_id):
+        with self._leases_lock:
+            self._leases.pop(job_id, None)
+        self.wake.set()  # освободился поток - можно взять следующую задачу
+
+    def _dispatch(self):
+        while True:
+            has_slot, max_priority = self._free_slot()
+            if not has_slot:
+                return
+            job = claim_job(max_priority)
+            if job is None:
+                return
+
+            with self._leases_lock:
+                self._leases[job.id] = (job.claim_token, job.priority)
+            future = self.worker.add_task(
+                _execute_job, job.id, job.claim_token, job.kind, dict(job.payload or {}),
+                priority=job.priority,
+                app=self.app
+            )
+            future.add_done_callback(lambda _, job_id=job.id: self._release(job_id))
+
+
+def start_job_runner(app):
+    """Запускает обработчик очереди в текущем процессе (если он не отключен JOB_RUNNER_ENABLED=0)"""
+    global _runner
+    if not JOB_RUNNER_ENABLED:
+        return None
+    worker = get_api_worker()
+    with _lock:
+        if _runner is None:
+            _runner = JobRunner(app, worker)
+            _runner.start()
+        return _runner
+
+
+def _wake_runner():
+    if _runner is not None:
+        _runner.wake.set()
@@ -0,0 +1,184 @@
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable, List, Optional
+from zoneinfo import ZoneInfo
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+from extensions.db_connection import db
+from models import MatchStats
+from pubg_api.client import PUBGApiClient, PUBGNotFoundException
+from pubg_api.models import MatchData
+from services.negative_cache_service import get_cached_error
+
+logger = logging.getLogger(__name__)
+
+
+class MatchRepository:
+    """
+    Единая точка получения матчей PUBG.
+
+    Порядок поиска: LRU в памяти процесса -> запись MatchStats в БД -> PUBG API
+    (с сохранением в БД). Матчи не меняются после окончания, поэтому кеш без TTL.
+    Исходный JSON матча хранится в БД, поэтому в памяти по умолчанию остаются только разобранные записи.
+    """
+
+    LOOKUP_CHUNK = 500  # id в одном IN (...), с запасом до лимита переменных SQLite
+
+    def __init__(self, capacity: int = 256, client=None, keep_raw: bool = False):
+        self.capacity = capacity
+        self.keep_raw = keep_raw
+        self._client = client
+        self._cache = OrderedDict()  # match_id -> MatchData
+        self._lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "api_fetches": 0,
+            "negative_hits": 0,  # матч недавно не нашелся в API (кеш ошибок), запрос не отправлялся
+            "not_found": 0,
+            "stored": 0
+        }
+
+    @property
+    def client(self):
+        # Клиент создаем лениво: для чтения из кеша ключ API не нужен
+        if self._client is None:
+            self._client = PUBGApiClient()
+        return self._client
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _remember(self, match_id: str, match_data: MatchData):
+        with self._lock:
+            self._cache[match_id] = match_data
+            self._cache.move_to_end(match_id)
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+
+    def _from_memory(self, match_id: str) -> Optional[MatchData]:
+        with self._lock:
+            match_data = self._cache.get(match_id)
+            if match_data is not None:
+                self._cache.move_to_end(match_id)
+            return match_data
+
+    def get(self, match_id: str, shard: str = "steam") -> Optional[MatchData]:
+        """
+        Возвращает матч по id или None, если такого матча нет в API.
+        Ошибки соединения с API пробрасываются дальше.
+        """
+        match_data = self._from_memory(match_id)
+        if match_data is not None:
+            self._count("memory_hits")
+            return match_data
+
+        db_match = MatchStats.query.filter_by(match_id=match_id).first()
+        if db_match:
+            self._count("db_hits")
+            # Участники разбираются, только если странице они понадобятся
+            match_data = db_match.to_match_data(keep_raw=self.keep_raw, lazy=True)
+            self._remember(match_id, match_data)
+            return match_data
+
+        # Тот же ключ, что у PUBGApiClient.get_match_by_id: повторный 404 не считается запросом к API
+        if get_cached_error(f"match:{shard}:{match_id}"):
+            self._count("negative_hits")
+            return None
+
+        self._count("api_fetches")
+        try:
+            match_data = self.client.get_match_by_id(match_id, shard=shard)
+        except PUBGNotFoundException:
+            match_data = None
+
+        if not match_data or not match_data.id:
+            self._count("not_found")
+            return None
+
+        # raw_data уже пуст, если этот же объект (общий ответ single-flight) сохранил параллельный запрос
+        if match_data.raw_data is not None:
+            self.store(match_data)
+            if not self.keep_raw:
+                match_data.drop_raw_data()
+        self._remember(match_id, match_data)
+        return match_data
+
+    def store(self, match_data: MatchData) -> bool:
+        """Сохраняет матч в БД, если его там еще нет. Возвращает True, если запись добавлена"""
+        try:
+            db.session.add(MatchStats(
+                match_id=match_data.id,
+                data_json=match_data.raw_data,
+                processed_at=datetime.now(ZoneInfo("Europe/Moscow"))
+            ))
+            db.session.commit()
+        except IntegrityError:
+            # Матч уже сохранил параллельный запрос
+            db.session.rollback()
+            return False
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Ошибка сохранения матча {match_data.id}: {str(e)}")
+            return False
+
+        self._count("stored")
+        return True
+
+    def missing_ids(self, match_ids: Iterable[str]) -> List[str]:
+        """id матчей, которых еще нет в БД (с сохранением порядка)"""
+        ids = list(dict.fromkeys(match_id for match_id in match_ids if match_id))
+        stored = set()
+        for i in range(0, len(ids), self.LOOKUP_CHUNK):
+            chunk = ids[i:i + self.LOOKUP_CHUNK]
+            stored.update(
+                match_id for (match_id,) in
+                db.session.query(MatchStats.match_id).filter(MatchStats.match_id.in_(chunk))
+            )
+        return [match_id for match_id in ids if match_id not in stored]
+
+    def store_many(self, matches: Iterable[MatchData]) -> int:
+        """
+        Сохраняет пачку матчей одним запросом в одной транзакции, уже сохраненные пропускаются.
+        Возвращает количество добавленных записей
+        """
+        now = datetime.now(ZoneInfo("Europe/Moscow"))
+        rows = [
+            {"match_id": match_data.id, "data_json": match_data.raw_data, "processed_at": now}
+            for match_data in matches
+            if match_data and match_data.raw_data and "data" in match_data.raw_data
+        ]
+        if not rows:
+            return 0
+
+        try:
+            result = db.session.execute(
+                sqlite_insert(MatchStats).values(rows).on_conflict_do_nothing(index_elements=[MatchStats.match_id])
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Ошибка пакетного сохранения матчей: {str(e)}")
+            return 0
+
+        with self._lock:
+            self._stats["stored"] += result.rowcount
+        return result.rowcount
+
+    def stats(self) -> dict:
+        """Статистика попаданий в кеш"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached"] = len(self._cache)
+
+        hits = stats["memory_hits"] + stats["db_hits"] + stats["negative_hits"]
+        total = hits + stats["api_fetches"]
+        stats["hit_rate"] = round(hits / total * 100, 1) if total else 0.0
+        return stats
+
+
+match_repository = MatchRepository()
@@ -0,0 +1,87 @@
+import os
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from flask import has_app_context
+from sqlalchemy.exc import IntegrityError
+from models import ApiNegativeCache
+from extensions.db_connection import db
+
+# Сколько секунд помнить постоянную ошибку API
+NEGATIVE_CACHE_TTL = int(os.getenv("PUBG_NEGATIVE_CACHE_TTL", 3600))
+
+def get_cached_error(cache_key):
+    """
+    Возвращает запомненную ошибку по ключу или None.
+    Вне контекста приложения (например, в потоках async-клиента) кеш не используется
+    """
+    if not has_app_context():
+        return None
+
+    now = datetime.now(ZoneInfo("Europe/Moscow"))
+    return ApiNegativeCache.query.filter(
+        ApiNegativeCache.cache_key == cache_key,
+        ApiNegativeCache.expires_at > now
+    ).first()
+
+def remember_error(cache_key, error, status_code=None, ttl=None):
+    """Запоминает постоянную ошибку API на ttl секунд"""
+    if not has_app_context():
+        return
+
+    expires_at = datetime.now(ZoneInfo("Europe/Moscow")) + timedelta(seconds=ttl or NEGATIVE_CACHE_TTL)
+    entry = ApiNegativeCache.query.filter_by(cache_key=cache_key).first()
+
+    try:
+        if entry:
+            entry.error = str(error)[:512]
+            entry.status_code = status_code
+            entry.expires_at = expires_at
+        else:
+            db.session.add(ApiNegativeCache(
+                cache_key=cache_key,
+                error=str(error)[:512],
+                status_code=status_code,
+                expires_at=expires_at
+            ))
+        db.session.commit()
+    except IntegrityError:
+        # Ту же ошибку только что запомнил другой процесс
+        db.session.rollback()
+
+# Ключей в одном IN (...), с запасом до лимита переменных SQLite
+KEYS_CHUNK = 500
+
+def cached_error_keys(cache_keys):
+    """Какие из ключей есть в кеше ошибок (одним запросом на пачку ключей)"""
+    keys = list(dict.fromkeys(cache_keys))
+    now = datetime.now(ZoneInfo("Europe/Moscow"))
+    found = set()
+    for i in range(0, len(keys), KEYS_CHUNK):
+        found.update(key for (key,) in db.session.query(ApiNegativeCache.cache_key).filter(
+            ApiNegativeCache.cache_key.in_(keys[i:i + KEYS_CHUNK]),
+            ApiNegativeCache.expires_at > now
+        ))
+    return found
+
+def prolong_errors(cache_keys, ttl):
+    """Продлевает запомненные ошибки до ttl секунд от текущего момента (ошибка заведомо не исчезнет)"""
+    keys = list(dict.fromkeys(cache_keys))
+    if not keys:
+        return
+    expires_at = datetime.now(ZoneInfo("Europe/Moscow")) + timedelta(seconds=ttl)
+    for i in range(0, len(keys), KEYS_CHUNK):
+        ApiNegativeCache.query.filter(ApiNegativeCache.cache_key.in_(keys[i:i + KEYS_CHUNK])).update(
+            {"expires_at": expires_at}, synchronize_session=False
+        )
+    db.session.commit()
+
+def clear_negative_cache():
+    """Очищает кеш ошибок. Возвращает количество удаленных записей"""
+    deleted = ApiNegativeCache.query.delete()
+    db.session.commit()
+    return deleted
+
+def negative_cache_size():
+    """Количество действующих записей в кеше ошибок"""
+    now = datetime.now(ZoneInfo("Europe/Moscow"))
+    return ApiNegativeCache.query.filter(ApiNegativeCache.expires_at > now).count()
@@ -0,0 +1,111 @@
+import logging
+import os
+from datetime import timedelta
+from models import User, PlayerStats, ApiJob, JobStatusEnum
+from extensions.db_connection import db
+from pubg_api.queue_worker import Priority
+from services.job_queue import enqueue_job, get_api_worker, job_handler
+from services.negative_cache_service import get_cached_error
+from utils.helpers import moscow_now, time_since
+
+logger = logging.getLogger(__name__)
+
+# Статистика старше этого возраста обновляется в фоне при просмотре профиля
+STATS_MAX_AGE = timedelta(minutes=int(os.getenv("PROFILE_STATS_MAX_AGE", 30)))
+
+REFRESH_JOB = "refresh_player_stats"
+# После неудачного (мертвого) обновления просмотры профиля не ставят новое раньше этого времени
+REFRESH_DEAD_BACKOFF = timedelta(hours=1)
+
+def is_stale(cached_stats):
+    """Нужно ли обновить статистику игрока"""
+    if not cached_stats or not cached_stats.stats_json or not cached_stats.updated_at:
+        return True
+
+    return time_since(cached_stats.updated_at) > STATS_MAX_AGE
+
+def refresh_player_stats(user_id):
+    """Загружает свежие данные игрока из API и сохраняет их в PlayerStats"""
+    client = get_api_worker().client
+    user = User.query.get(user_id)
+    if not user:
+        return None
+
+    cached_stats = PlayerStats.query.filter_by(user_id=user.id).first()
+    # По известному pubg_id игрок (с последними матчами) загружается без поиска по нику;
+    # поиск нужен, только если id еще нет или API его больше не знает
+    player = None
+    if cached_stats and cached_stats.pubg_id:
+        player = client.get_players_by_ids([cached_stats.pubg_id]).get(cached_stats.pubg_id)
+    if player is None:
+        player = client.get_player_by_name(user.pubg_nickname)
+    stats = client.get_player_lifetime_stats_by_id(player.id)
+
+    if not cached_stats:
+        cached_stats = PlayerStats(user_id=user.id)
+        db.session.add(cached_stats)
+
+    cached_stats.pubg_id = player.id
+    cached_stats.stats_json = stats.to_dict() if stats else {}
+    cached_stats.match_ids = player.match_ids
+    cached_stats.updated_at = moscow_now()
+    db.session.commit()
+    return cached_stats
+
+@job_handler(REFRESH_JOB)
+def _refresh_job(user_id):
+    try:
+        refresh_player_stats(user_id)
+    except Exception as e:
+        logger.warning(f"Фоновое обновление статистики пользователя {user_id} не удалось: {str(e)}")
+        raise
+
+def _refresh_key(user_id):
+    return f"{REFRESH_JOB}:{user_id}"
+
+def _latest_refresh_job(user_id):
+    return ApiJob.query.filter_by(dedup_key=_refresh_key(user_id)).order_by(ApiJob.id.desc()).first()
+
+def _refresh_blocked(user_id):
+    """
+    Обновление заведомо не удастся: ник недавно не нашелся в API
+    или последнее обновление недавно ушло в dead letter
+    """
+    user = User.query.get(user_id)
+    if user and get_cached_error(f"player:steam:{user.pubg_nickname}"):
+        return True
+
+    job = _latest_refresh_job(user_id)
+    if not job or job.status != JobStatusEnum.DEAD or not job.finished_at:
+        return False
+    return time_since(job.finished_at) < REFRESH_DEAD_BACKOFF
+
+def queue_refresh(user_id, priority=Priority.BACKGROUND, force=False):
+    """
+    Ставит обновление статистики в персистентную очередь.
+    Повторный запрос не создает дубль, а при необходимости повышает приоритет ожидающего обновления.
+    Без force обновление не ставится, если оно заведомо не удастся (см. _refresh_blocked).
+    Возвращает True, если обновление поставлено или уже ожидает выполнения
+    """
+    if not force and _refresh_blocked(user_id):
+        return False
+
+    try:
+        enqueue_job(REFRESH_JOB, {"user_id": user_id}, priority=priority, dedup_key=_refresh_key(user_id))
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Не удалось поставить обновление статистики в очередь: {str(e)}")
+        return False
+    return True
+
+def get_refresh_status(user_id):
+    """Состояние статистики для опроса со страницы профиля"""
+    cached_stats = PlayerStats.query.filter_by(user_id=user_id).first()
+    job = _latest_refresh_job(user_id)
+    pending = bool(job and job.status in (JobStatusEnum.PENDING, JobStatusEnum.RUNNING))
+
+    return {
+        "updated_at": cached_stats.updated_at.isoformat() if cached_stats and cached_stats.updated_at else None,
+        "pending": pending,
+        "error": job.last_error if job and job.status == JobStatusEnum.DEAD else None
+    }
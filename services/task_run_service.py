@@ -0,0 +1,66 @@
+from datetime import timedelta
+from sqlalchemy.exc import IntegrityError
+from models import TaskRun, TaskRunStatusEnum
+from extensions.db_connection import db
+from utils.helpers import moscow_now, time_since
+
+# Запуск без отметок дольше этого времени считается прерванным (процесс упал)
+RUN_STALE_AFTER = timedelta(minutes=30)
+
+def _is_stale(run):
+    return time_since(run.heartbeat_at or run.started_at) > RUN_STALE_AFTER
+
+def start_task_run(task_name):
+    """
+    Начинает запуск задачи.
+
+    Returns:
+        (запуск, курсор прерванного / незавершенного запуска или None);
+        (None, None), если задача уже выполняется в другом процессе
+    """
+    previous = TaskRun.query.filter_by(task_name=task_name).order_by(TaskRun.id.desc()).first()
+    cursor = None
+
+    if previous:
+        if previous.status == TaskRunStatusEnum.RUNNING:
+            if not _is_stale(previous):
+                return None, None
+            previous.status = TaskRunStatusEnum.INTERRUPTED
+            previous.finished_at = previous.heartbeat_at
+        if previous.status in (TaskRunStatusEnum.INTERRUPTED, TaskRunStatusEnum.PARTIAL):
+            cursor = previous.cursor
+
+    run = TaskRun(task_name=task_name, resumed_from_id=previous.id if cursor else None, outcomes={})
+    db.session.add(run)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Другой процесс начал запуск между проверкой и вставкой (uq_task_run_running)
+        db.session.rollback()
+        return None, None
+    return run, cursor
+
+def checkpoint_task_run(run, cursor, outcomes=None, api_calls=0, total=None):
+    """Сохраняет прогресс: курсор, результаты по элементам и счетчики"""
+    if outcomes:
+        merged = dict(run.outcomes or {})
+        merged.update({str(key): value for key, value in outcomes.items()})
+        run.outcomes = merged
+        run.processed = sum(1 for value in merged.values() if value == "ok")
+        run.failed = len(merged) - run.processed
+    if total is not None:
+        run.total = total
+    run.cursor = cursor
+    run.api_calls = (run.api_calls or 0) + api_calls
+    run.heartbeat_at = moscow_now()
+    db.session.commit()
+
+def finish_task_run(run, status, error=None):
+    run.status = status
+    run.error = str(error)[:1024] if error else None
+    run.finished_at = moscow_now()
+    db.session.commit()
+
+def task_run_history(limit=20):
+    """Последние запуски задач для страницы задач"""
+    return TaskRun.query.order_by(TaskRun.id.desc()).limit(limit).all()
@@ -0,0 +1,35 @@
+// Ожидание фонового обновления статистики PUBG: опрашиваем статус и перезагружаем страницу, когда данные обновились
+window.watchStatsRefresh = function(statusUrl, initialUpdatedAt, timeoutMs = 120000) {
+    const startedAt = Date.now();
+
+    const timer = setInterval(async function() {
+        try {
+            const response = await fetch(statusUrl, {
+                headers: { 'X-Requested-With': 'XMLHttpRequest' }
+            });
+            if (!response.ok) {
+                return;
+            }
+
+            const data = await response.json();
+
+            if (data.updated_at && data.updated_at !== initialUpdatedAt) {
+                clearInterval(timer);
+                window.location.reload();
+                return;
+            }
+
+            if (!data.pending && data.error) {
+                clearInterval(timer);
+                toastr.warning('Не удалось обновить статистику. Попробуйте позже.');
+                return;
+            }
+
+            if (Date.now() - startedAt > timeoutMs) {
+                clearInterval(timer);
+            }
+        } catch (error) {
+            console.error('Error:', error);
+        }
+    }, 3000);
+};
@@ -0,0 +1,28 @@
+import os
+import tempfile
+
+import pytest
+
+# Клиент PUBG API читает окружение при импорте: лимитер - во временный файл, а не в instance/
+os.environ.setdefault("PUBG_API_KEY", "test")
+os.environ.setdefault("PUBG_RATE_LIMIT_DB", os.path.join(tempfile.mkdtemp(), "rate_limit.db"))
+
+from flask import Flask
+
+from extensions import json_codec
+from extensions.db_connection import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Приложение с пустой временной SQLite-базой (без планировщика и обработчика очереди)"""
+    app = Flask("tests")
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+        SQLALCHEMY_ENGINE_OPTIONS=dict(json_codec.ENGINE_OPTIONS)
+    )
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
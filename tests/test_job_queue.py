@@ -0,0 +1,136 @@
+from datetime import timedelta
+
+from extensions.db_connection import db
+from models import ApiJob, JobStatusEnum
+from pubg_api.queue_worker import Priority
+from services.job_queue import claim_job, complete_job, enqueue_job, renew_leases
+from utils.helpers import moscow_now
+
+
+def test_claim_takes_highest_priority_then_oldest(app):
+    first = enqueue_job("refresh", {"n": 1})
+    second = enqueue_job("refresh", {"n": 2})
+    urgent = enqueue_job("refresh", {"n": 3}, priority=Priority.INTERACTIVE)
+
+    claimed = [claim_job().id for _ in range(3)]
+
+    assert claimed == [urgent.id, first.id, second.id]
+    assert claim_job() is None
+
+
+def test_claim_sets_lease_and_counts_attempt(app):
+    job = enqueue_job("refresh")
+
+    claimed = claim_job()
+
+    assert claimed.id == job.id
+    assert claimed.status == JobStatusEnum.RUNNING
+    assert claimed.claim_token
+    assert claimed.attempts == 1
+    assert claimed.lease_until is not None
+
+
+def test_claim_respects_max_priority_and_run_after(app):
+    enqueue_job("refresh")
+    enqueue_job("refresh", priority=Priority.INTERACTIVE, delay=60)
+
+    # Интерактивная задача еще не готова, а фоновая ниже допустимого приоритета
+    assert claim_job(max_priority=Priority.INTERACTIVE) is None
+    assert claim_job().priority == Priority.BACKGROUND
+
+
+def test_expired_lease_is_reclaimed_with_new_token(app):
+    enqueue_job("refresh")
+    first = claim_job()
+    old_token = first.claim_token
+    first.lease_until = moscow_now() - timedelta(seconds=1)
+    db.session.commit()
+
+    again = claim_job()
+
+    assert again.id == first.id
+    assert again.claim_token != old_token
+    assert again.attempts == 2
+
+
+def test_job_out_of_attempts_goes_dead_on_reclaim(app):
+    job = enqueue_job("refresh", max_attempts=1)
+    claim_job()
+    job.lease_until = moscow_now() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert claim_job() is None
+    db.session.refresh(job)
+    assert job.status == JobStatusEnum.DEAD
+
+
+def test_renew_leases_extends_own_lease(app):
+    enqueue_job("refresh")
+    job = claim_job()
+    job.lease_until = moscow_now() + timedelta(seconds=5)
+    db.session.commit()
+
+    assert renew_leases({job.id: job.claim_token}) == []
+    db.session.refresh(job)
+    assert job.lease_until > moscow_now().replace(tzinfo=None) + timedelta(seconds=60)
+
+
+def test_renew_leases_reports_job_taken_by_another_process(app):
+    enqueue_job("refresh")
+    job = claim_job()
+    stale_token = job.claim_token
+    job.lease_until = moscow_now() - timedelta(seconds=1)
+    db.session.commit()
+    claim_job()  # аренду забрал другой процесс
+
+    assert renew_leases({job.id: stale_token}) == [job.id]
+    assert renew_leases({}) == []
+
+
+def test_duplicate_raises_priority_of_pending_job(app):
+    job = enqueue_job("refresh", {"user_id": 1}, dedup_key="refresh:1")
+
+    duplicate = enqueue_job("refresh", {"user_id": 1}, priority=Priority.INTERACTIVE, dedup_key="refresh:1")
+
+    assert duplicate.id == job.id
+    assert duplicate.priority == Priority.INTERACTIVE
+    assert ApiJob.query.count() == 1
+
+
+def test_lower_priority_duplicate_keeps_priority(app):
+    job = enqueue_job("refresh", priority=Priority.INTERACTIVE, dedup_key="refresh:1")
+
+    duplicate = enqueue_job("refresh", dedup_key="refresh:1")
+
+    assert duplicate.id == job.id
+    assert duplicate.priority == Priority.INTERACTIVE
+
+
+def test_running_duplicate_is_returned_unchanged(app):
+    job = enqueue_job("refresh", dedup_key="refresh:1")
+    claim_job()
+
+    duplicate = enqueue_job("refresh", priority=Priority.INTERACTIVE, dedup_key="refresh:1")
+
+    assert duplicate.id == job.id
+    assert duplicate.status == JobStatusEnum.RUNNING
+    assert duplicate.priority == Priority.BACKGROUND
+
+
+def test_finished_job_does_not_block_new_one(app):
+    job = enqueue_job("refresh", dedup_key="refresh:1")
+    claimed = claim_job()
+    complete_job(claimed.id, claimed.claim_token)
+
+    new_job = enqueue_job("refresh", dedup_key="refresh:1")
+
+    assert new_job.id != job.id
+    assert ApiJob.query.filter_by(dedup_key="refresh:1").count() == 2
+
+
+def test_idempotency_key_returns_existing_job_in_any_status(app):
+    job = enqueue_job("refresh", idempotency_key="admin:42")
+    claimed = claim_job()
+    complete_job(claimed.id, claimed.claim_token)
+
+    assert enqueue_job("refresh", idempotency_key="admin:42").id == job.id
@@ -0,0 +1,101 @@
+import pytest
+
+from pubg_api import rate_limiter
+from pubg_api.rate_limiter import SharedTokenBucket
+
+
+class FakeClock:
+    """Подменяет модуль time лимитера: время идет только по advance()"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def bucket(clock, tmp_path):
+    # 10 токенов за 10 секунд - один токен в секунду
+    return SharedTokenBucket(name="test", capacity=10, period=10, db_path=str(tmp_path / "rate_limit.db"))
+
+
+def test_reserve_queues_behind_previous_reservations(bucket):
+    assert bucket.reserve(10) == 0.0
+    assert bucket.reserve() == pytest.approx(1.0)
+    assert bucket.reserve() == pytest.approx(2.0)
+    assert bucket.remaining() == 0
+
+
+def test_reserve_over_max_wait_takes_nothing(bucket):
+    bucket.reserve(10)
+    assert bucket.reserve(max_wait=0.5) is None
+    assert bucket.try_acquire() is False
+    # Отказ не встал в очередь: следующий резерв ждет один токен, а не три
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def test_tokens_refill_over_time(bucket, clock):
+    bucket.reserve(10)
+    clock.advance(3)
+    assert bucket.remaining() == 3
+    clock.advance(60)
+    assert bucket.remaining() == 10  # не больше емкости
+
+
+def test_pause_until_blocks_tokens_until_reset(bucket, clock):
+    bucket.pause_until(clock.now + 30)
+    assert bucket.remaining() == 0
+    assert bucket.try_acquire() is False
+    assert bucket.time_to_next_token() == pytest.approx(30)
+
+    clock.advance(31)
+    # После сброса окна API ведро снова полное
+    assert bucket.remaining() == 10
+
+
+def test_pause_keeps_reservations_made_before_it(bucket, clock):
+    bucket.reserve(12)  # два токена в долг
+    bucket.pause_until(clock.now + 30)
+    clock.advance(30)
+    assert bucket.remaining() == 8
+
+
+def test_calibrate_applies_limit_and_lower_remaining(bucket, clock):
+    bucket.calibrate(limit=20, remaining=5, reset_at=None)
+    assert bucket.remaining() == 5
+
+    # API насчитал больше, чем мы: наши резервы он еще не видел, остаток не растет
+    bucket.calibrate(limit=20, remaining=8, reset_at=None)
+    assert bucket.remaining() == 5
+
+    clock.advance(1)  # 20 токенов за 10 секунд - два в секунду
+    assert bucket.remaining() == 7
+
+
+def test_calibrate_with_exhausted_window_pauses_until_reset(bucket, clock):
+    bucket.calibrate(limit=10, remaining=0, reset_at=clock.now + 45)
+    assert bucket.remaining() == 0
+    assert bucket.time_to_next_token() == pytest.approx(45)
+
+    clock.advance(46)
+    assert bucket.remaining() == 10
+
+
+def test_buckets_share_state_through_the_file(bucket, tmp_path):
+    other = SharedTokenBucket(name="test", capacity=10, period=10, db_path=str(tmp_path / "rate_limit.db"))
+    other.reserve(4)
+    assert bucket.remaining() == 6
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from pubg_api.singleflight import SingleFlight
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("условие не выполнилось за отведенное время")
+        time.sleep(0.005)
+
+
+def run_followers(flight, key, count, func):
+    """Запускает count вызовов с ключом key в потоках; возвращает (потоки, результаты)"""
+    results = []
+
+    def call():
+        try:
+            results.append(flight.do(key, func))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {"id": "match"}
+
+    threads, results = run_followers(flight, ("match", "m1"), 5, fetch)
+    wait_for(lambda: flight.stats()["coalesced"] == 4)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 5
+    assert all(result is results[0] for result in results)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_error_reaches_every_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        raise ValueError("API недоступен")
+
+    threads, results = run_followers(flight, ("player", "Nick"), 4, fetch)
+    wait_for(lambda: flight.stats()["coalesced"] == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 4
+    assert all(isinstance(result, ValueError) for result in results)
+    assert all(result is results[0] for result in results)
+
+
+def test_error_is_not_cached():
+    flight = SingleFlight()
+    attempts = []
+
+    def fetch():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ValueError("временная ошибка")
+        return "ok"
+
+    with pytest.raises(ValueError):
+        flight.do("key", fetch)
+    assert flight.do("key", fetch) == "ok"
+    assert flight.stats() == {"calls": 2, "coalesced": 0, "in_flight": 0}
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    assert flight.do(("player", "a", True), lambda: "blocking") == "blocking"
+    assert flight.do(("player", "a", False), lambda: "interactive") == "interactive"
+    assert flight.stats()["coalesced"] == 0
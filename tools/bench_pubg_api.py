@@ -0,0 +1,325 @@
+"""
+Замеры клиента PUBG API на локальном стенде (tools/pubg_standin.py).
+
+    python -m tools.bench_pubg_api handshake --requests 200 --connect-delay 0.03
+        общий keep-alive пул PUBGApiClient против нового соединения на каждый запрос
+    python -m tools.bench_pubg_api sweep --users 500
+        update_all_player_stats по синтетическому клану во временной БД: время и число коммитов
+    python -m tools.bench_pubg_api columns --players 100
+        расчеты по матчу (топ, итоги команд, перцентили) циклами Python против колонок NumPy
+    python -m tools.bench_pubg_api memory --matches 50
+        память на разобранный матч (tracemalloc): с исходным JSON, без него, записи словарями
+    python -m tools.bench_pubg_api json --matches 200
+        разбор и сериализация ответа /matches: стандартный json против orjson (extensions.json_codec)
+    python -m tools.bench_pubg_api queue --tasks 500 --rate 100
+        шквал задач через APIQueueWorker с общим лимитером: ожидание по приоритетам и stats()
+
+Стенд запускается в этом же процессе на свободном порту, реальный ключ и база приложения не нужны.
+"""
+import argparse
+import gc
+import json
+import os
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from datetime import timedelta
+
+from tools.pubg_standin import make_server, match_payload
+
+
+def start_standin(limit, connect_delay=0.0, match_latency=0.0):
+    server = make_server(port=0, limit=limit, connect_delay=connect_delay, match_latency=match_latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def configure_env(server, workdir):
+    """Клиент читает адрес API и путь лимитера из окружения при импорте"""
+    os.environ["PUBG_API_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.setdefault("PUBG_API_KEY", "standin")
+    os.environ["PUBG_RATE_LIMIT_DB"] = os.path.join(workdir, "rate_limit.db")
+
+
+def bench_handshake(args, workdir):
+    server = start_standin(limit=10, connect_delay=args.connect_delay)
+    configure_env(server, workdir)
+    import requests
+    from pubg_api.client import PUBGApiClient
+
+    client = PUBGApiClient(blocking=True)
+    state = server.RequestHandlerClass.state
+    endpoints = [f"/shards/steam/matches/bench-{i}" for i in range(args.requests)]
+
+    def fresh(endpoint):
+        with requests.Session() as session:
+            session.get(f"{client.BASE_URL}{endpoint}", headers=client.headers, timeout=client.timeout).json()
+
+    for label, call in (("новое соединение на запрос", fresh), ("общий keep-alive пул", client._get)):
+        connections = state.connections
+        started = time.perf_counter()
+        for endpoint in endpoints:
+            call(endpoint)
+        elapsed = time.perf_counter() - started
+        print(f"{label}: {elapsed:.2f} с, {elapsed / len(endpoints) * 1000:.1f} мс/запрос, "
+              f"новых соединений: {state.connections - connections}")
+
+
+def bench_sweep(args, workdir):
+    server = start_standin(limit=1_000_000)
+    configure_env(server, workdir)
+    from flask import Flask
+    from sqlalchemy import event
+    from extensions import json_codec
+    from extensions.db_connection import db
+    from models import User, RoleEnum
+    from pubg_api.tasks.update_all_player_stats import update_all_player_stats
+
+    app = Flask("bench")
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        SQLALCHEMY_ENGINE_OPTIONS=dict(json_codec.ENGINE_OPTIONS)
+    )
+    db.init_app(app)
+
+    commits = [0]
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            User(username=f"bench{i}", password="-", pubg_nickname=f"Bench{i}", email=f"bench{i}@example.com",
+                 role=RoleEnum.CLAN_MEMBER)
+            for i in range(args.users)
+        ])
+        db.session.commit()
+        event.listen(db.engine, "commit", lambda connection: commits.__setitem__(0, commits[0] + 1))
+
+    for label in ("первый запуск (pubg_id + статистика)", "повторный запуск (только статистика)"):
+        commits[0] = 0
+        started = time.perf_counter()
+        result = update_all_player_stats(app, min_age=timedelta(0), api_budget=1_000_000)
+        elapsed = time.perf_counter() - started
+        print(f"{label}: {elapsed:.2f} с, коммитов: {commits[0]}, обновлено: {result.get('processed')}, "
+              f"запросов к API: {result.get('api_calls')}")
+
+
+def per_call_us(func, number):
+    """Лучшее из трех повторов, мкс на вызов"""
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+
+def bench_columns(args, workdir):
+    from pubg_api.models.columns import ParticipantColumns
+    from pubg_api.models.match import MatchData
+
+    match = MatchData(match_payload("bench", players=args.players))
+    participants = match.participants
+    player = participants[len(participants) // 2].name
+
+    # Те же расчеты циклами по записям участников, как до колоночного представления
+    def loop_top(count=5):
+        players = sorted(participants, key=lambda p: (-p.stats.kills, -p.stats.damage_dealt))
+        return [(p.name or "Unknown", p.stats.kills) for p in players[:count]]
+
+    def loop_team_totals():
+        teams = {}
+        for p in participants:
+            if not p.roster_id:
+                continue
+            team = teams.setdefault(p.roster_id, {"roster_id": p.roster_id, "rank": 0, "kills": 0, "damage": 0.0, "members": 0})
+            team["rank"] = p.stats.team_rank
+            team["kills"] += p.stats.kills
+            team["damage"] += p.stats.damage_dealt
+            team["members"] += 1
+        for team in teams.values():
+            team["damage"] = round(team["damage"], 1)
+        return sorted(teams.values(), key=lambda team: (team["rank"] if team["rank"] > 0 else 1 << 31, -team["kills"]))
+
+    def loop_percentiles(name=player):
+        me = next(p for p in participants if p.name == name)
+        distance = lambda p: p.stats.walk_distance + p.stats.ride_distance
+        share = lambda condition: round(sum(1 for p in participants if condition(p)) * 100 / len(participants), 1)
+        return {
+            "kills": share(lambda p: p.stats.kills <= me.stats.kills),
+            "damage": share(lambda p: p.stats.damage_dealt <= me.stats.damage_dealt),
+            "time_survived": share(lambda p: p.stats.time_survived <= me.stats.time_survived),
+            "distance": share(lambda p: distance(p) <= distance(me))
+        }
+
+    cases = (
+        ("топ игроков", loop_top, match.get_top_players),
+        ("итоги команд", loop_team_totals, match.get_team_totals),
+        ("перцентили игрока", loop_percentiles, lambda: match.get_player_percentiles(player)),
+    )
+    for label, loop, vectorized in cases:
+        assert loop() == vectorized(), f"{label}: результаты циклов и NumPy расходятся"
+
+    print(f"матч на {len(participants)} игроков, результаты циклов и NumPy совпадают")
+    print(f"построение колонок (один раз на матч): {per_call_us(lambda: ParticipantColumns(participants), 200):.1f} мкс")
+    for label, loop, vectorized in cases:
+        loop_us = per_call_us(loop, args.number)
+        vectorized_us = per_call_us(vectorized, args.number)
+        print(f"{label}: циклы {loop_us:.1f} мкс, NumPy {vectorized_us:.1f} мкс (x{loop_us / vectorized_us:.1f})")
+
+
+def traced_kib(build, count):
+    """Память, которую удерживают count результатов build(i), КиБ на результат"""
+    gc.collect()
+    tracemalloc.start()
+    kept = [build(index) for index in range(count)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return current / count / 1024
+
+
+def bench_memory(args, workdir):
+    from pubg_api.models.match import MatchData
+
+    # Каждый матч разбирается из своей копии JSON, как ответ API или запись MatchStats
+    payload = json.dumps(match_payload("bench", players=args.players))
+
+    def records(_):
+        match = MatchData(json.loads(payload), keep_raw=False)
+        return match.participants, match.rosters
+
+    def dicts(_):
+        # Прежнее представление: участники и команды вложенными словарями
+        match = MatchData(json.loads(payload), keep_raw=False)
+        return [participant.to_dict() for participant in match.participants], [roster.to_dict() for roster in match.rosters]
+
+    print(f"матч на {args.players} игроков, {len(payload) // 1024} КиБ JSON, замер на {args.matches} матчах")
+    print(f"MatchData с исходным JSON (keep_raw=True): "
+          f"{traced_kib(lambda _: MatchData(json.loads(payload)), args.matches):.0f} КиБ/матч")
+    print(f"MatchData без исходного JSON (keep_raw=False): "
+          f"{traced_kib(lambda _: MatchData(json.loads(payload), keep_raw=False), args.matches):.0f} КиБ/матч")
+    print(f"участники и команды: записи со __slots__ {traced_kib(records, args.matches):.0f} КиБ/матч, "
+          f"словари {traced_kib(dicts, args.matches):.0f} КиБ/матч")
+
+
+def bench_json(args, workdir):
+    from extensions import json_codec
+
+    payload = match_payload("bench", players=args.players)
+    raw = json.dumps(payload).encode()
+    assert json_codec.loads(raw) == json.loads(raw) == payload
+    assert json_codec.loads(json_codec.dumps(payload)) == payload
+
+    print(f"матч на {args.players} игроков, {len(raw) // 1024} КиБ JSON, кодек: {json_codec.BACKEND}, "
+          f"результаты совпадают со стандартным json")
+    if json_codec.orjson is None:
+        print("orjson не установлен: кодек использует стандартный json (pip install orjson)")
+
+    cases = (
+        ("разбор", lambda: json.loads(raw), lambda: json_codec.loads(raw)),
+        ("сериализация", lambda: json.dumps(payload), lambda: json_codec.dumps(payload)),
+    )
+    for label, stdlib, codec in cases:
+        stdlib_us = per_call_us(stdlib, args.matches)
+        codec_us = per_call_us(codec, args.matches)
+        print(f"{label}: json {stdlib_us:.0f} мкс, {json_codec.BACKEND} {codec_us:.0f} мкс (x{stdlib_us / codec_us:.1f})")
+
+
+def bench_queue(args, workdir):
+    from pubg_api.queue_worker import APIQueueWorker, Priority, TaskDeadlineExceeded
+    from pubg_api.rate_limiter import SharedTokenBucket
+
+    bucket = SharedTokenBucket(name="bench", capacity=args.rate, period=1, db_path=os.path.join(workdir, "queue.db"))
+
+    def api_call(index):
+        bucket.acquire()
+        time.sleep(args.latency)  # ответ API
+        return index
+
+    worker = APIQueueWorker(workers=args.workers, max_queue_size=args.tasks)
+    worker.start()
+
+    latencies = {Priority.INTERACTIVE: [], Priority.BACKGROUND: []}
+    futures = {}  # id -> (Future, приоритет); дубль по dedup_key возвращает Future уже ожидающей задачи
+
+    def track(future, priority, submitted):
+        def done(result):
+            if not result.cancelled() and result.exception() is None:
+                latencies[priority].append(time.perf_counter() - submitted)
+        if id(future) not in futures:
+            futures[id(future)] = future, priority
+            future.add_done_callback(done)
+
+    started = time.perf_counter()
+    for index in range(args.tasks):
+        if index % 10 == 0:
+            priority, dedup_key, deadline = Priority.INTERACTIVE, None, None
+        else:
+            # Плановое обновление: повторные постановки того же игрока схлопываются, старые задачи истекают
+            priority, dedup_key, deadline = Priority.BACKGROUND, f"player:{index % args.players}", args.deadline
+        track(worker.add_task(api_call, index, priority=priority, deadline=deadline, dedup_key=dedup_key),
+              priority, time.perf_counter())
+    # Отмена последних фоновых задач, еще не взятых в работу
+    background = [future for future, priority in futures.values() if priority == Priority.BACKGROUND]
+    cancelled = sum(future.cancel() for future in background[-args.cancel:]) if args.cancel else 0
+
+    expired = 0
+    for future, _ in futures.values():
+        if future.cancelled():
+            continue
+        try:
+            future.result()
+        except TaskDeadlineExceeded:
+            expired += 1
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.tasks} задач, {args.workers} потоков, лимит {args.rate}/с, ответ API {args.latency * 1000:.0f} мс: "
+          f"{elapsed:.2f} с, отменено {cancelled}, истекло {expired}")
+    for priority, label in ((Priority.INTERACTIVE, "интерактивные"), (Priority.BACKGROUND, "фоновые")):
+        values = sorted(latencies[priority])
+        if values:
+            print(f"{label}: {len(values)} выполнено, до результата p50 {values[len(values) // 2] * 1000:.0f} мс, "
+                  f"p99 {values[min(int(len(values) * 0.99), len(values) - 1)] * 1000:.0f} мс")
+    print(f"stats(): {worker.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры клиента PUBG API на локальном стенде")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    handshake = commands.add_parser("handshake", help="keep-alive пул против нового соединения")
+    handshake.add_argument("--requests", type=int, default=200)
+    handshake.add_argument("--connect-delay", type=float, default=0.03,
+                           help="стоимость рукопожатия на стенде, сек. (TLS до api.pubg.com - десятки мс)")
+
+    sweep = commands.add_parser("sweep", help="обновление статистики синтетического клана")
+    sweep.add_argument("--users", type=int, default=500)
+
+    columns = commands.add_parser("columns", help="расчеты по матчу: циклы против NumPy")
+    columns.add_argument("--players", type=int, default=100)
+    columns.add_argument("--number", type=int, default=2000, help="вызовов на замер")
+
+    memory = commands.add_parser("memory", help="память на разобранный матч")
+    memory.add_argument("--players", type=int, default=100)
+    memory.add_argument("--matches", type=int, default=50)
+
+    json_bench = commands.add_parser("json", help="стандартный json против orjson")
+    json_bench.add_argument("--players", type=int, default=100)
+    json_bench.add_argument("--matches", type=int, default=200, help="вызовов на замер")
+
+    queue = commands.add_parser("queue", help="шквал задач через APIQueueWorker")
+    queue.add_argument("--tasks", type=int, default=500)
+    queue.add_argument("--workers", type=int, default=8)
+    queue.add_argument("--rate", type=int, default=100, help="токенов лимитера в секунду")
+    queue.add_argument("--latency", type=float, default=0.01, help="время ответа API, сек.")
+    queue.add_argument("--players", type=int, default=300, help="разных игроков у фоновых задач (дубли схлопываются)")
+    queue.add_argument("--deadline", type=float, default=1.0, help="дедлайн начала фоновых задач, сек.")
+    queue.add_argument("--cancel", type=int, default=10, help="сколько последних фоновых задач отменить")
+
+    args = parser.parse_args()
+    benches = {
+        "handshake": bench_handshake, "sweep": bench_sweep, "columns": bench_columns,
+        "memory": bench_memory, "json": bench_json, "queue": bench_queue
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        benches[args.command](args, workdir)
+
+
+if __name__ == "__main__":
+    main()
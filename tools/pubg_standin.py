@@ -0,0 +1,213 @@
+"""
+Локальный стенд PUBG API для проверки клиента и замеров без реального ключа.
+
+Запуск:
+    python -m tools.pubg_standin --port 8765 --limit 10 --connect-delay 0.05
+и в окружении приложения / бенчмарка:
+    PUBG_API_BASE_URL=http://127.0.0.1:8765
+
+Что умеет стенд:
+- /shards/{shard}/players?filter[playerNames]=... и ?filter[playerIds]=... (ники, начинающиеся
+  с "ghost", не находятся; пачка только из таких ников отвечает 404, как настоящий API);
+- /shards/{shard}/players/{id}/seasons/lifetime и /seasons/lifetime/gameMode/{mode}/players;
+- /shards/{shard}/matches/{id} - синтетический матч на 100 игроков, без лимита (как в API);
+  id, начинающиеся с "gone", отвечают 404 (матч старше срока хранения);
+- лимит запросов в минуту с заголовками X-RateLimit-* и ответом 429;
+- --connect-delay имитирует стоимость TCP/TLS-рукопожатия на каждое новое соединение;
+- GET /stats - счетчики запросов по типам и число принятых соединений.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+def player_payload(name):
+    return {
+        "type": "player",
+        "id": f"account.{name.lower()}",
+        "attributes": {"name": name, "shardId": "steam"},
+        "relationships": {
+            "matches": {"data": [{"type": "match", "id": f"m-{name.lower()}-{i}"} for i in range(3)]}
+        }
+    }
+
+
+def match_payload(match_id, players=100):
+    """Матч в формате /matches: ростеры по 4 игрока, участники, ассет телеметрии"""
+    included = []
+    for roster in range(players // 4):
+        included.append({
+            "type": "roster",
+            "id": f"r{roster}",
+            "attributes": {"stats": {"rank": roster + 1, "teamId": roster}, "won": "true" if roster == 0 else "false"},
+            "relationships": {
+                "participants": {"data": [{"type": "participant", "id": f"p{roster * 4 + k}"} for k in range(4)]}
+            }
+        })
+    for index in range(players):
+        included.append({
+            "type": "participant",
+            "id": f"p{index}",
+            "attributes": {"stats": {
+                "name": f"Player{index}", "playerId": f"account.player{index}",
+                "kills": index % 7, "damageDealt": index * 3.5, "winPlace": index // 4 + 1,
+                "timeSurvived": 100 + index, "walkDistance": 10.0 * index, "rideDistance": 5.0 * index,
+                "headshotKills": index % 3, "longestKill": 1.5 * index, "DBNOs": index % 2,
+                "assists": 1, "revives": 0, "vehicleDestroys": 0, "deathType": "byplayer"
+            }}
+        })
+    included.append({"type": "asset", "id": "a1", "attributes": {"URL": "http://127.0.0.1/telemetry"}})
+
+    return {
+        "data": {
+            "type": "match",
+            "id": match_id,
+            "attributes": {
+                "createdAt": "2025-01-01T12:00:00Z", "duration": 1800, "gameMode": "squad-fpp",
+                "mapName": "Baltic_Main", "isCustomMatch": False, "shardId": "steam", "titleId": "bluehole-pubg"
+            },
+            "relationships": {
+                "rosters": {"data": [{"type": "roster", "id": f"r{roster}"} for roster in range(players // 4)]},
+                "assets": {"data": [{"type": "asset", "id": "a1"}]}
+            }
+        },
+        "included": included
+    }
+
+
+def season_payload(player_id, game_mode):
+    stats = {"wins": 1, "losses": 4, "kills": 8, "assists": 2, "damageDealt": 500.0,
+             "longestKill": 100.0, "headshotKills": 2, "roundsPlayed": 5}
+    return {
+        "type": "playerSeason",
+        "attributes": {"gameModeStats": {game_mode: stats}},
+        "relationships": {"player": {"data": {"type": "player", "id": player_id}}}
+    }
+
+
+class StandinState:
+    def __init__(self, limit, connect_delay, match_latency):
+        self.limit = limit
+        self.connect_delay = connect_delay
+        self.match_latency = match_latency
+        self.lock = threading.Lock()
+        self.window = time.time()
+        self.used = 0
+        self.connections = 0
+        self.calls = {}
+
+    def count(self, kind):
+        with self.lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+
+    def take_token(self):
+        """Расходует запрос из минутного окна; False - лимит исчерпан"""
+        with self.lock:
+            now = time.time()
+            if now - self.window >= 60:
+                self.window = now
+                self.used = 0
+            if self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
+
+    def to_dict(self):
+        with self.lock:
+            return {"connections": self.connections, "calls": dict(self.calls), "used": self.used, "limit": self.limit}
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у api.pubg.com
+    disable_nagle_algorithm = True  # заголовки и тело пишутся раздельно, иначе keep-alive ждет delayed ACK
+    state: StandinState = None
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.state.lock:
+            self.state.connections += 1
+        if self.state.connect_delay:
+            time.sleep(self.state.connect_delay)  # стоимость рукопожатия нового соединения
+
+    def send_json(self, code, body, metered=True):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/vnd.api+json")
+        self.send_header("Content-Length", str(len(data)))
+        if metered:
+            self.send_header("X-RateLimit-Limit", str(self.state.limit))
+            self.send_header("X-RateLimit-Remaining", str(max(self.state.limit - self.state.used, 0)))
+            self.send_header("X-RateLimit-Reset", str(int(self.state.window + 60)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")
+
+        if url.path == "/stats":
+            return self.send_json(200, self.state.to_dict(), metered=False)
+
+        if len(parts) == 4 and parts[2] == "matches":
+            self.state.count("matches")
+            if self.state.match_latency:
+                time.sleep(self.state.match_latency)
+            if parts[3].startswith("gone"):
+                return self.send_json(404, {"errors": [{"title": "Not Found"}]}, metered=False)
+            return self.send_json(200, match_payload(parts[3]), metered=False)
+
+        self.state.count(parts[2] if len(parts) > 2 else url.path)
+        if not self.state.take_token():
+            return self.send_json(429, {"errors": [{"title": "Too Many Requests"}]})
+
+        if url.path.endswith("/players") and "gameMode" in parts:
+            game_mode = parts[parts.index("gameMode") + 1]
+            ids = query.get("filter[playerIds]", "").split(",")
+            return self.send_json(200, {"data": [season_payload(player_id, game_mode) for player_id in ids if player_id]})
+
+        if len(parts) == 3 and parts[2] == "players":
+            if "filter[playerNames]" in query:
+                names = [name for name in query["filter[playerNames]"].split(",") if not name.lower().startswith("ghost")]
+            else:
+                names = [player_id.split(".", 1)[-1] for player_id in query.get("filter[playerIds]", "").split(",") if player_id]
+            if not names:
+                return self.send_json(404, {"errors": [{"title": "Not Found"}]})
+            return self.send_json(200, {"data": [player_payload(name) for name in names]})
+
+        if url.path.endswith("/seasons/lifetime"):
+            return self.send_json(200, {"data": season_payload(parts[3], "squad-fpp")})
+
+        self.send_json(404, {"errors": [{"title": "Not Found"}]})
+
+
+def make_server(port=8765, limit=10, connect_delay=0.0, match_latency=0.05, host="127.0.0.1"):
+    """HTTP-сервер стенда (serve_forever() запускает вызывающий)"""
+    handler = type("Handler", (StandinHandler,), {"state": StandinState(limit, connect_delay, match_latency)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный стенд PUBG API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--limit", type=int, default=10, help="запросов в минуту к лимитируемым эндпоинтам")
+    parser.add_argument("--connect-delay", type=float, default=0.0, help="задержка на новое соединение, сек.")
+    parser.add_argument("--match-latency", type=float, default=0.05, help="задержка ответа /matches, сек.")
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.limit, args.connect_delay, args.match_latency)
+    print(f"Стенд PUBG API: http://127.0.0.1:{args.port} (лимит {args.limit}/мин)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 import io
 import pandas as pd
 import xlsxwriter
@@ -6,6 +7,17 @@ import os
 
 from models.match import Match
 
+# Текущее время в часовом поясе приложения (все отметки времени в БД - московские)
+def moscow_now():
+    return datetime.now(ZoneInfo("Europe/Moscow"))
+
+# Сколько прошло с момента из БД
+def time_since(moment) -> timedelta:
+    now = moscow_now()
+    if moment.tzinfo is None:
+        now = now.replace(tzinfo=None)  # SQLite возвращает время без зоны
+    return now - moment
+
 # Максировка email
 def mask_email(email):
     if not email or '@' not in email: